@@ -1,6 +1,4 @@
-import os
-
-from flee import InputGeography
+from fleesim import bundle
 
 
 def get_flare_window(flare_day, window_size):
@@ -36,26 +34,11 @@ class Country:
         self.name = country_name
         print(scenario_path)
 
-        input_directory = os.path.join(scenario_path, "input_csv")
-        print(input_directory)
-
-        input_geography = InputGeography.InputGeography()
-
-        print(os.path.join(input_directory, "locations.csv"))
-        input_geography.ReadLocationsFromCSV(
-            os.path.join(input_directory, "locations.csv")
-        )
-
-        no_ancillary_input_data = False
-        try:
-            input_geography.ReadLinksFromCSV(
-                os.path.join(input_directory, "routes.csv")
-            )
-            input_geography.ReadClosuresFromCSV(
-                os.path.join(input_directory, "closures.csv")
-            )
-        except FileNotFoundError:
-            no_ancillary_input_data = True
+        # Locations, routes and closures come from the compiled scenario bundle
+        scenario_bundle = bundle.load_bundle(scenario_path, sections=("geography",))
+        input_geography = scenario_bundle.input_geography()
+
+        no_ancillary_input_data = bool(scenario_bundle["geography_incomplete"])
 
         self.locations = {}
 
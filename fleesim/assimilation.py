@@ -0,0 +1,94 @@
+import os
+
+import numpy as np
+
+from . import ensemble
+
+
+SCORE_FILE = "score.txt"
+LOG_FILE = "assimilation.csv"
+
+
+def observed_days(d, camp_names, num_days):
+    """Days on which RefugeeTable <d> has an actual (not interpolated) value for at least one camp."""
+    return [t for t in range(num_days) if any(not d.is_interpolated(name, t) for name in camp_names)]
+
+
+def segment_ends(days, num_days):
+    """Stop days of the filter segments: the day after each observation day, and the end of the run."""
+    stops = sorted(set(t + 1 for t in days if 0 < t + 1 < num_days))
+    return stops + [num_days]
+
+
+def segment_dir(directory, segment, member):
+    return os.path.join(directory, "segment_%03d" % segment, str(member))
+
+
+def write_score(directory, segment, member, error):
+    path = os.path.join(segment_dir(directory, segment, member), SCORE_FILE)
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path, "w") as f:
+        f.write("%r\n" % float(error))
+
+
+def _read_score(directory, segment, member):
+    with open(os.path.join(segment_dir(directory, segment, member), SCORE_FILE)) as f:
+        return float(f.read())
+
+
+def particle_weights(errors, sigma):
+    """Normalised weights exp(-error^2 / 2 sigma^2); uniform if every member failed to score."""
+    errors = np.asarray(errors, dtype=float)
+    log_weights = np.where(np.isfinite(errors), -0.5 * (errors / sigma) ** 2, -np.inf)
+    if not np.isfinite(log_weights).any():
+        return np.full(len(errors), 1.0 / len(errors))
+    weights = np.exp(log_weights - log_weights.max())
+    return weights / weights.sum()
+
+
+def systematic_resample(weights, num_members):
+    """Member indices drawn with systematic resampling: low variance, keeps every member of weight >= 1/n."""
+    positions = (np.random.random() + np.arange(num_members)) / num_members
+    return np.minimum(np.searchsorted(np.cumsum(weights), positions), len(weights) - 1)
+
+
+def run_filter(directory, num_members, stops, sigma, concurrency=None):
+    """
+    Run a particle filter over forked ensemble members.
+
+    The run is cut into segments ending at <stops>. For every segment the
+    parent forks <num_members> children from its pristine state. Like
+    ensemble.fork_members(), this returns in each child, as (member, segment,
+    start day, stop day, source): the child continues from the snapshot in
+    the <source> directory, or from day 0 when it is None, and runs until the
+    stop day. There it stores a snapshot and its error with
+    write_score() in segment_dir(directory, segment, member).
+
+    Between segments the parent weights the members by their errors,
+    resamples them systematically and logs the choice to <directory>/
+    assimilation.csv. The parent gets (None, ...) once the last segment has
+    finished, with the failed members of the segment that stopped it.
+    """
+    os.makedirs(directory, exist_ok=True)
+    log_path = os.path.join(directory, LOG_FILE)
+    with open(log_path, "w") as log:
+        log.write("segment,stop day,member,parent,error,weight\n")
+
+    parents = [None] * num_members
+    start = 0
+    for segment, stop in enumerate(stops):
+        member, failed = ensemble.fork_members(num_members, concurrency)
+        if member is not None:
+            source = None if parents[member] is None else segment_dir(directory, segment - 1, parents[member])
+            return member, segment, start, stop, source
+        if len(failed) > 0 or segment == len(stops) - 1:
+            return None, segment, start, stop, failed
+
+        errors = [_read_score(directory, segment, i) for i in range(num_members)]
+        weights = particle_weights(errors, sigma)
+        with open(log_path, "a") as log:
+            for i in range(num_members):
+                parent = "" if parents[i] is None else parents[i]
+                log.write("%d,%d,%d,%s,%r,%r\n" % (segment, stop, i, parent, errors[i], float(weights[i])))
+        parents = [int(i) for i in systematic_resample(weights, num_members)]
+        start = stop
@@ -0,0 +1,141 @@
+import os
+import sys
+import time
+
+import numpy as np
+
+from . import checkpoint
+
+
+BALANCE_FILE = "load_balance.csv"
+
+
+def imbalance(counts):
+    """Load imbalance max/mean - 1 of per-rank <counts>; 0 when evenly spread or empty."""
+    counts = np.asarray(counts, dtype=float)
+    if counts.size == 0 or counts.sum() == 0:
+        return 0.0
+    return counts.max() / counts.mean() - 1.0
+
+
+def transfers(counts):
+    """
+    (sender, receiver, number) moves that even out per-rank agent <counts>,
+    pairing ranks above their share with ranks below it in rank order. The
+    same on every rank, as it only depends on the gathered counts.
+    """
+    counts = np.asarray(counts, dtype=np.int64)
+    size = len(counts)
+    total = int(counts.sum())
+    target = np.full(size, total // size, dtype=np.int64)
+    target[: total % size] += 1
+    surplus = counts - target
+    senders = [[r, int(n)] for r, n in enumerate(surplus) if n > 0]
+    receivers = [[r, int(-n)] for r, n in enumerate(surplus) if n < 0]
+    moves = []
+    while len(senders) > 0 and len(receivers) > 0:
+        number = min(senders[0][1], receivers[0][1])
+        moves.append((senders[0][0], receivers[0][0], number))
+        senders[0][1] -= number
+        receivers[0][1] -= number
+        if senders[0][1] == 0:
+            senders.pop(0)
+        if receivers[0][1] == 0:
+            receivers.pop(0)
+    return moves
+
+
+class LoadBalancer:
+    """
+    Per-rank agent and timing telemetry of a pflee run, with rebalancing.
+
+    Call start() before the evolve phase of each day and day_done(<t>) after
+    it: the agent count and evolve time of every rank are gathered, and when
+    the agent imbalance (max/mean - 1) exceeds <threshold>, agents are moved
+    in bulk from ranks above their share to ranks below it, in one all-to-all
+    exchange. A threshold of 0 only records. On close(), rank 0 writes a
+    per-day table to <path> and prints a summary.
+    """
+
+    def __init__(self, e, num_days, threshold=0.0, path=BALANCE_FILE):
+        self.e = e
+        self.rank = e.mpi.rank
+        self.size = e.mpi.size
+        self.threshold = threshold
+        self.path = path
+        self.agents = np.zeros((num_days, self.size), dtype=np.int64)
+        self.seconds = np.zeros((num_days, self.size))
+        self.migrated = np.zeros(num_days, dtype=np.int64)
+        self.stop = 0
+        self.started = 0.0
+
+    def start(self):
+        self.started = time.perf_counter()
+
+    def _gather(self, value):
+        return self.e.mpi.comm.allgather(value) if self.size > 1 else [value]
+
+    def day_done(self, t):
+        """Record day <t> on every rank (collective), and rebalance if needed."""
+        seconds = time.perf_counter() - self.started
+        gathered = self._gather((len(self.e.agents), seconds))
+        self.agents[t] = [n for n, _ in gathered]
+        self.seconds[t] = [s for _, s in gathered]
+        self.stop = t + 1
+        if self.size > 1 and self.threshold > 0 and imbalance(self.agents[t]) > self.threshold:
+            self.migrated[t] = self.rebalance(self.agents[t])
+
+    def rebalance(self, counts):
+        """Even out the agents over the ranks given their <counts>. Returns the number moved in total."""
+        outgoing = [[] for _ in range(self.size)]
+        moves = transfers(counts)
+        for sender, receiver, number in moves:
+            if sender == self.rank:
+                # Hand over the most recently added agents.
+                outgoing[receiver] = self.e.agents[-number:]
+                del self.e.agents[-number:]
+                for a in outgoing[receiver]:
+                    a.location.DecrementNumAgents()
+        received = self.e.mpi.comm.alltoall(
+            [checkpoint.encode_agents(self.e, agents) if len(agents) > 0 else {} for agents in outgoing]
+        )
+        for arrays in received:
+            checkpoint.decode_agents(self.e, arrays)
+        return sum(number for _, _, number in moves)
+
+    def close(self, file=sys.stderr):
+        """Write the per-day table and print a summary on rank 0."""
+        if self.rank != 0 or self.stop == 0:
+            return
+        agents = self.agents[: self.stop]
+        seconds = self.seconds[: self.stop]
+        ranks = range(self.size)
+        directory = os.path.dirname(self.path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        with open(self.path, "w") as f:
+            f.write("Day,%s,%s,agent imbalance,time imbalance,migrated\n" % (
+                ",".join("agents rank %d" % r for r in ranks),
+                ",".join("seconds rank %d" % r for r in ranks),
+            ))
+            for t in range(self.stop):
+                f.write("%d,%s,%s,%.4f,%.4f,%d\n" % (
+                    t,
+                    ",".join("%d" % n for n in agents[t]),
+                    ",".join("%.6f" % s for s in seconds[t]),
+                    imbalance(agents[t]),
+                    imbalance(seconds[t]),
+                    self.migrated[t],
+                ))
+        rebalanced = np.count_nonzero(self.migrated[: self.stop])
+        print(
+            "Load balance over %d days on %d ranks: mean agent imbalance %.3f, mean time imbalance %.3f, "
+            "%d rebalances moving %d agents; evolve time per rank %s s (%s)"
+            % (
+                self.stop, self.size,
+                np.mean([imbalance(n) for n in agents]), np.mean([imbalance(s) for s in seconds]),
+                rebalanced, self.migrated[: self.stop].sum(),
+                np.round(seconds.sum(axis=0), 2).tolist(), self.path,
+            ),
+            file=file,
+        )
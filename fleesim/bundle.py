@@ -0,0 +1,253 @@
+import hashlib
+import os
+
+import numpy as np
+from flee import InputGeography
+from flee.datamanager import handle_refugee_data, read_period
+
+from . import observations
+
+
+BUNDLE_FILE = "scenario_bundle.npz"
+
+# Input files (relative to the scenario directory) behind each section of a bundle.
+GEOGRAPHY_FILES = ["input_csv/locations.csv", "input_csv/routes.csv", "input_csv/closures.csv"]
+CONFLICT_FILES = ["input_csv/conflicts.csv"]
+OBSERVATION_FILES = ["input_csv/registration_corrections.csv"]
+
+SECTIONS = ("geography", "conflicts", "observations")
+
+
+def _hash_files(scenario_path, files, extra=()):
+    h = hashlib.sha1()
+    for name in files:
+        # Hash relative names, so a copied scenario keeps a valid bundle.
+        h.update(name.encode())
+        path = os.path.join(scenario_path, name)
+        if os.path.isfile(path):
+            with open(path, "rb") as f:
+                h.update(f.read())
+        else:
+            h.update(b"<missing>")
+    h.update(repr(tuple(extra)).encode())
+    return h.hexdigest()
+
+
+def section_hash(section, scenario_path, scaledown_factor=1):
+    """Content hash of the inputs that <section> of the bundle is compiled from."""
+    if section == "geography":
+        return _hash_files(scenario_path, GEOGRAPHY_FILES)
+    if section == "conflicts":
+        return _hash_files(scenario_path, CONFLICT_FILES)
+
+    # Only the start date of conflict_period.csv affects the observations.
+    start_date, _ = read_period.read_conflict_period(os.path.join(scenario_path, "input_csv", "conflict_period.csv"))
+    files = OBSERVATION_FILES + [
+        os.path.join("source_data", f) for f in sorted(os.listdir(os.path.join(scenario_path, "source_data")))
+    ]
+    return _hash_files(scenario_path, files, extra=(start_date, scaledown_factor))
+
+
+def _string_table(rows):
+    """Pad ragged CSV rows into a 2D string array, keeping each row's length."""
+    width = max((len(row) for row in rows), default=0)
+    table = np.array([list(row) + [""] * (width - len(row)) for row in rows], dtype=str).reshape(len(rows), width)
+    return table, np.array([len(row) for row in rows], dtype=np.int32)
+
+
+def _string_rows(table, lengths):
+    return [list(row[:n]) for row, n in zip(table.tolist(), lengths)]
+
+
+def _compile_geography(scenario_path):
+    input_directory = os.path.join(scenario_path, "input_csv")
+    ig = InputGeography.InputGeography()
+    ig.ReadLocationsFromCSV(os.path.join(input_directory, "locations.csv"))
+
+    incomplete = False
+    try:
+        ig.ReadLinksFromCSV(os.path.join(input_directory, "routes.csv"))
+        ig.ReadClosuresFromCSV(os.path.join(input_directory, "closures.csv"))
+    except FileNotFoundError:
+        incomplete = True
+        ig.links = []
+        ig.closures = []
+
+    locations, location_lengths = _string_table(ig.locations)
+    location_ids = {row[0]: i for i, row in enumerate(ig.locations)}
+
+    route_from = np.empty(len(ig.links), dtype=np.int32)
+    route_to = np.empty(len(ig.links), dtype=np.int32)
+    route_distance = np.empty(len(ig.links))
+    route_forced = np.full(len(ig.links), -1, dtype=np.int8)  # -1: no forced_redirection column
+    for i, link in enumerate(ig.links):
+        for name in link[:2]:
+            if name not in location_ids:
+                raise ValueError("Route %s-%s refers to unknown location %s" % (link[0], link[1], name))
+        route_from[i] = location_ids[link[0]]
+        route_to[i] = location_ids[link[1]]
+        route_distance[i] = float(link[2])
+        if len(link) > 3 and link[3].strip() != "":
+            route_forced[i] = int(link[3])
+
+    closures, closure_lengths = _string_table(ig.closures)
+
+    return {
+        "locations": locations,
+        "location_row_lengths": location_lengths,
+        "route_from": route_from,
+        "route_to": route_to,
+        "route_distance": route_distance,
+        "route_forced": route_forced,
+        "closures": closures,
+        "closure_row_lengths": closure_lengths,
+        "geography_incomplete": np.array(incomplete),
+    }
+
+
+def _compile_conflicts(scenario_path):
+    conflicts_file = os.path.join(scenario_path, "input_csv", "conflicts.csv")
+    if not os.path.isfile(conflicts_file):
+        return {"conflict_names": np.array([], dtype=str), "conflicts": np.zeros((0, 0), dtype=np.int32)}
+
+    ig = InputGeography.InputGeography()
+    ig.ReadFlareConflictInputCSV(conflicts_file)
+    names = list(ig.conflicts.keys())
+    return {
+        "conflict_names": np.array(names, dtype=str),
+        "conflicts": np.array([ig.conflicts[name] for name in names]).T,
+    }
+
+
+def _compile_observations(scenario_path, num_days, scaledown_factor):
+    input_directory = os.path.join(scenario_path, "input_csv")
+    data_directory = os.path.join(scenario_path, "source_data")
+    start_date, length = read_period.read_conflict_period(os.path.join(input_directory, "conflict_period.csv"))
+    num_days = max(num_days, length)
+
+    d = handle_refugee_data.RefugeeTable(
+        csvformat="generic",
+        data_directory=data_directory,
+        start_date=start_date,
+        data_layout="data_layout.csv",
+        population_scaledown_factor=scaledown_factor,
+    )
+    d.ReadL1Corrections(os.path.join(input_directory, "registration_corrections.csv"))
+
+    names = [name for name in d.header if name != "total"]
+    obs, daily_difference = observations.build_observations(d, names, num_days)
+    return {
+        "observation_names": np.array(names, dtype=str),
+        "observations": obs,
+        "daily_difference": daily_difference,
+    }
+
+
+class Bundle:
+    """
+    A compiled scenario: integer location IDs with route arrays, the closure
+    table, the days x locations conflict matrix and the interpolated
+    observations, loaded from a single .npz file.
+    """
+
+    def __init__(self, arrays):
+        self.arrays = arrays
+
+    def __getitem__(self, key):
+        return self.arrays[key]
+
+    @property
+    def location_names(self):
+        return [str(name) for name in self.arrays["locations"][:, 0]]
+
+    def input_geography(self):
+        """An InputGeography holding the bundled tables, as if read from the CSVs."""
+        ig = InputGeography.InputGeography()
+        names = self.location_names
+
+        ig.locations = _string_rows(self.arrays["locations"], self.arrays["location_row_lengths"])
+        ig.links = []
+        for a, b, distance, forced in zip(
+            self.arrays["route_from"], self.arrays["route_to"],
+            self.arrays["route_distance"], self.arrays["route_forced"],
+        ):
+            link = [names[a], names[b], "%d" % distance if distance == int(distance) else str(distance)]
+            if forced >= 0:
+                link.append(str(forced))
+            ig.links.append(link)
+        ig.closures = _string_rows(self.arrays["closures"], self.arrays["closure_row_lengths"])
+
+        if "conflict_names" in self.arrays:
+            ig.conflicts = {
+                str(name): column.tolist()
+                for name, column in zip(self.arrays["conflict_names"], self.arrays["conflicts"].T)
+            }
+        return ig
+
+    def observations(self, names, num_days):
+        """Observation matrix (num_days, len(names)) and daily total differences."""
+        index = {str(name): i for i, name in enumerate(self.arrays["observation_names"])}
+        columns = [index[name] for name in names]
+        return self.arrays["observations"][:num_days, columns], self.arrays["daily_difference"][:num_days]
+
+
+def load_bundle(scenario_path, sections=SECTIONS, num_days=0, scaledown_factor=1, save=True):
+    """
+    Load <scenario_path>/scenario_bundle.npz, first recompiling any of the
+    requested <sections> whose input files changed since it was written.
+    Sections that were not requested are carried over untouched. Recompiled
+    sections are written back to the file unless <save> is False.
+    """
+    bundle_file = os.path.join(scenario_path, BUNDLE_FILE)
+    arrays = {}
+    if os.path.isfile(bundle_file):
+        with np.load(bundle_file) as f:
+            arrays = dict(f)
+
+    stale = False
+    for section in sections:
+        current = section_hash(section, scenario_path, scaledown_factor)
+        stored = str(arrays["hash_%s" % section]) if "hash_%s" % section in arrays else None
+        if section == "observations" and stored == current:
+            stored_days = arrays["observations"].shape[0]
+            if stored_days < num_days:
+                stored = None
+        if stored == current:
+            continue
+
+        if section == "geography":
+            arrays.update(_compile_geography(scenario_path))
+        elif section == "conflicts":
+            arrays.update(_compile_conflicts(scenario_path))
+        else:
+            arrays.update(_compile_observations(scenario_path, num_days, scaledown_factor))
+        arrays["hash_%s" % section] = np.array(current)
+        stale = True
+
+    if stale and save:
+        tmp_file = "%s.%d.tmp" % (bundle_file, os.getpid())
+        with open(tmp_file, "wb") as f:
+            np.savez(f, **arrays)
+        os.replace(tmp_file, bundle_file)
+
+    return Bundle(arrays)
+
+
+def compile_bundle(scenario_path, num_days=0, scaledown_factor=1):
+    """Compile (or refresh) every section of the bundle of <scenario_path>."""
+    return load_bundle(scenario_path, SECTIONS, num_days, scaledown_factor)
+
+
+if __name__ == "__main__":
+    import argparse
+
+    arg_parser = argparse.ArgumentParser(
+        description="Compile a scenario directory into a binary scenario_bundle.npz."
+    )
+    arg_parser.add_argument("scenario_path", type=str, help="Path to the directory that contains the scenario")
+    arg_parser.add_argument("--ndays", type=int, default=0, help="Number of days of observations to bundle (at least the conflict period).")
+    arg_parser.add_argument("--scaledown", type=int, default=1, help="PopulationScaledownFactor used for the observations.")
+    args = arg_parser.parse_args()
+
+    compile_bundle(args.scenario_path, num_days=args.ndays, scaledown_factor=args.scaledown)
+    print(os.path.join(args.scenario_path, BUNDLE_FILE))
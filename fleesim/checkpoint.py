@@ -0,0 +1,220 @@
+import glob
+import os
+import random
+import re
+import sys
+
+import numpy as np
+from mpi4py import MPI
+
+from .person import Person
+
+
+CHECKPOINT_PATTERN = re.compile(r"checkpoint_(\d+)\.(\d+)\.npz$")
+
+
+def checkpoint_file(directory, day, rank):
+    return os.path.join(directory, "checkpoint_%06d.%d.npz" % (day, rank))
+
+
+def encode_agents(e, agents):
+    """Encode <agents> as flat arrays of location indices and travel state."""
+    index = {id(loc): i for i, loc in enumerate(e.locations)}
+    n = len(agents)
+    arrays = {
+        "agent_location": np.empty(n, dtype=np.int32),
+        "agent_link_end": np.full(n, -1, dtype=np.int32),
+        "agent_home": np.empty(n, dtype=np.int32),
+        "agent_travelling": np.empty(n, dtype=bool),
+        "agent_distance_on_link": np.empty(n),
+        "agent_timesteps_since_departure": np.empty(n, dtype=np.int32),
+        "agent_places_travelled": np.empty(n, dtype=np.int32),
+        "agent_recent_travel_distance": np.empty(n),
+        "agent_distance_moved_this_timestep": np.empty(n),
+        "agent_reached_camp": np.empty(n, dtype=bool),
+    }
+    for i, a in enumerate(agents):
+        if hasattr(a.location, "endpoint"):
+            # Agent is on a link: store it as (startpoint, endpoint).
+            arrays["agent_location"][i] = index[id(a.location.startpoint)]
+            arrays["agent_link_end"][i] = index[id(a.location.endpoint)]
+        else:
+            arrays["agent_location"][i] = index[id(a.location)]
+        arrays["agent_home"][i] = index[id(a.home_location)]
+        arrays["agent_travelling"][i] = a.travelling
+        arrays["agent_distance_on_link"][i] = a.distance_travelled_on_link
+        arrays["agent_timesteps_since_departure"][i] = a.timesteps_since_departure
+        arrays["agent_places_travelled"][i] = a.places_travelled
+        arrays["agent_recent_travel_distance"][i] = a.recent_travel_distance
+        arrays["agent_distance_moved_this_timestep"][i] = a.distance_moved_this_timestep
+        arrays["agent_reached_camp"][i] = a.reached_camp
+    return arrays
+
+
+def decode_agents(e, arrays):
+    """Create the agents encoded by encode_agents() on this rank, counted at their locations."""
+    for i in range(len(arrays.get("agent_location", ()))):
+        loc = e.locations[arrays["agent_location"][i]]
+        a = Person(e, loc)
+        link_end = arrays["agent_link_end"][i]
+        if link_end >= 0:
+            endpoint = e.locations[link_end]
+            link = next(l for l in loc.links + loc.closed_links if l.endpoint is endpoint)
+            loc.DecrementNumAgents()
+            a.location = link
+            link.IncrementNumAgents()
+        a.home_location = e.locations[arrays["agent_home"][i]]
+        a.travelling = bool(arrays["agent_travelling"][i])
+        a.distance_travelled_on_link = float(arrays["agent_distance_on_link"][i])
+        a.timesteps_since_departure = int(arrays["agent_timesteps_since_departure"][i])
+        a.places_travelled = int(arrays["agent_places_travelled"][i])
+        a.recent_travel_distance = float(arrays["agent_recent_travel_distance"][i])
+        a.distance_moved_this_timestep = float(arrays["agent_distance_moved_this_timestep"][i])
+        a.reached_camp = bool(arrays["agent_reached_camp"][i])
+        e.agents.append(a)
+
+
+def _closed_links(e):
+    return np.array(
+        ["%s|%s" % (loc.name, link.endpoint.name) for loc in e.locations for link in loc.closed_links],
+        dtype=str,
+    )
+
+
+def _rng_arrays():
+    np_state = np.random.get_state()
+    py_version, py_state, py_gauss = random.getstate()
+    return {
+        "np_rng_keys": np_state[1],
+        "np_rng_params": np.array([np_state[2], np_state[3], np_state[4]], dtype=float),
+        "py_rng_state": np.array(py_state, dtype=np.int64),
+        "py_rng_params": np.array([py_version, np.nan if py_gauss is None else py_gauss]),
+    }
+
+
+def _restore_rng(state):
+    pos, has_gauss, cached_gaussian = state["np_rng_params"]
+    np.random.set_state(("MT19937", state["np_rng_keys"], int(pos), int(has_gauss), cached_gaussian))
+    py_version, py_gauss = state["py_rng_params"]
+    random.setstate((
+        int(py_version),
+        tuple(int(x) for x in state["py_rng_state"]),
+        None if np.isnan(py_gauss) else float(py_gauss),
+    ))
+
+
+def save(directory, day, e, res, refugees_raw, refugee_debt, keep=2, engine=None, dormant=None, recorders=()):
+    """
+    Snapshot the simulation state of this rank before day <day> is simulated.
+
+    Covers the agents on this rank and their travel state, location populations,
+    conflict zones, closed links, the driver's refugee counters, the RNG states
+    and (on every rank, though only rank 0 has it filled) the output so far.
+    With an <engine>, its agent arrays are stored instead of the Person objects;
+    the counts of a DormantPopulation <dormant> are stored along with them, as
+    are the days recorded so far by the <recorders> (flows, OD counts, probes).
+    Only the <keep> most recent checkpoints of this rank are retained (0: all).
+    """
+    agents = encode_agents(e, e.agents) if engine is None else engine.state_arrays()
+    if dormant is not None:
+        agents["dormant_counts"] = dormant.counts
+    for recorder in recorders:
+        agents.update(recorder.state_arrays(day))
+    os.makedirs(directory, exist_ok=True)
+    rank = e.mpi.rank
+    path = checkpoint_file(directory, day, rank)
+    tmp_path = path + ".tmp"
+    with open(tmp_path, "wb") as f:
+        np.savez_compressed(
+            f,
+            day=day,
+            num_ranks=e.mpi.size,
+            total_agents=e.total_agents,
+            refugees_raw=refugees_raw,
+            refugee_debt=refugee_debt,
+            location_pop=np.array([loc.pop for loc in e.locations]),
+            location_spawned=np.array([loc.numAgentsSpawned for loc in e.locations], dtype=np.int64),
+            scores=e.scores,
+            conflict_zones=np.array(e.conflict_zone_names, dtype=str),
+            closed_links=_closed_links(e),
+            result_camp=res.camp[:day],
+            result_totals=res.totals[:day],
+            **agents,
+            **_rng_arrays(),
+        )
+    os.replace(tmp_path, path)
+
+    for old_day in sorted(_checkpoint_days(directory, rank))[:-keep]:
+        os.remove(checkpoint_file(directory, old_day, rank))
+
+
+def _checkpoint_days(directory, rank):
+    days = []
+    for path in glob.glob(os.path.join(directory, "checkpoint_*.npz")):
+        match = CHECKPOINT_PATTERN.search(path)
+        if match and int(match.group(2)) == rank:
+            days.append(int(match.group(1)))
+    return days
+
+
+def latest_day(directory, mpi, until=None):
+    """The latest day (not after <until>, if given) for which every rank has a checkpoint, or None."""
+    days = _checkpoint_days(directory, mpi.rank) if os.path.isdir(directory) else []
+    if until is not None:
+        days = [day for day in days if day <= until]
+    latest = mpi.comm.allreduce(max(days, default=-1), op=MPI.MIN)
+    return None if latest < 0 else latest
+
+
+def restore(directory, day, e, events, res, engine=None, dormant=None, recorders=()):
+    """
+    Bring a freshly built Ecosystem <e> to the state of the checkpoint of <day>.
+
+    Conflict zones and closures are rebuilt by replaying the earlier days of the
+    EventTimeline <events>, as a straight run applies them, and checked against
+    the snapshot. Agents, populations, scores, RNG states, the output so far
+    and the days recorded by the <recorders> are loaded from the snapshot.
+    Returns (refugees_raw, refugee_debt).
+    """
+    with np.load(checkpoint_file(directory, day, e.mpi.rank)) as f:
+        state = dict(f)
+
+    assert int(state["num_ranks"]) == e.mpi.size, "Checkpoint was written with a different number of ranks."
+    for recorder in recorders:
+        missing = [key for key in recorder.state_arrays(day) if key not in state]
+        assert len(missing) == 0, "Checkpoint was written without the recorded %s." % ", ".join(missing)
+
+    for t in range(day):
+        events.apply_conflicts(e, t)
+        events.apply_closures(e, t)
+
+    if sorted(e.conflict_zone_names) != sorted(str(name) for name in state["conflict_zones"]):
+        print("Warning: conflict zones differ from the checkpoint; have the inputs changed?", file=sys.stderr)
+    if sorted(_closed_links(e)) != sorted(state["closed_links"]):
+        print("Warning: closed links differ from the checkpoint; have the inputs changed?", file=sys.stderr)
+
+    for loc, pop, spawned in zip(e.locations, state["location_pop"], state["location_spawned"]):
+        loc.pop = pop
+        loc.numAgentsSpawned = int(spawned)
+    e.scores[:] = state["scores"]
+    e.refresh_conflict_weights()
+
+    if engine is not None:
+        engine.load_state_arrays(state)
+
+    decode_agents(e, state)
+
+    if dormant is not None and "dormant_counts" in state:
+        dormant.load(state["dormant_counts"])
+
+    e.total_agents = int(state["total_agents"])
+    e.time = day
+    e.updateNumAgents(log=False)
+
+    res.camp[:day] = state["result_camp"]
+    res.totals[:day] = state["result_totals"]
+    for recorder in recorders:
+        recorder.load_state_arrays(state, day)
+    _restore_rng(state)
+
+    return int(state["refugees_raw"]), int(state["refugee_debt"])
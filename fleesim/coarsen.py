@@ -0,0 +1,204 @@
+import csv
+import os
+import shutil
+
+
+MAPPING_FILE = "coarse_map.csv"
+
+# Location types that are never collapsed.
+KEPT_TYPES = ("camp", "conflict_zone", "forwarding_hub")
+
+
+def _read_csv(path):
+    """Returns (header rows starting with #, data rows) of a flee input CSV."""
+    header, rows = [], []
+    if not os.path.isfile(path):
+        return header, rows
+    with open(path, newline="") as f:
+        for row in csv.reader(f):
+            if len(row) == 0:
+                continue
+            (header if row[0].lstrip().startswith("#") else rows).append(row)
+    return header, rows
+
+
+def _write_csv(path, header, rows):
+    with open(path, "w", newline="") as f:
+        writer = csv.writer(f, lineterminator="\n")
+        writer.writerows(header + rows)
+
+
+def _add_route(adjacency, a, b, distance):
+    """Add (or shorten) the route a-b."""
+    if a == b:
+        return
+    distance = min(distance, adjacency[a].get(b, distance))
+    adjacency[a][b] = distance
+    adjacency[b][a] = distance
+
+
+def _remove_node(adjacency, name):
+    for other in adjacency.pop(name):
+        del adjacency[other][name]
+
+
+def coarsen(locations, routes, kept, merge_km=0.0):
+    """
+    Collapse the locations not in <kept> into super-nodes.
+
+    First, every removable location with exactly two neighbours is cut out of
+    its route and replaced by a direct route with the summed distance, so
+    travel distances along the route are preserved. Then, with <merge_km>,
+    removable locations whose nearest neighbour is closer than that are merged
+    into it: their routes start from the neighbour, lengthened by the distance
+    between the two, and their population is added to it.
+
+    <locations> are flee location rows, <routes> (name1, name2, distance)
+    tuples. Returns the coarse location rows, the coarse routes as
+    (name1, name2, distance), and {original name: (super-node, distance)}.
+    """
+    adjacency = {row[0]: {} for row in locations}
+    for a, b, distance in routes:
+        _add_route(adjacency, a, b, float(distance))
+
+    # Each removed location points to a neighbour it was folded into.
+    parent = {}
+    population = {row[0]: float(row[7]) if len(row) > 7 and row[7].strip() else 0.0 for row in locations}
+
+    changed = True
+    while changed:
+        changed = False
+        for name in list(adjacency):
+            if name in kept or name not in adjacency:
+                continue
+            neighbours = adjacency[name]
+            if len(neighbours) == 2:
+                (a, da), (b, db) = neighbours.items()
+                _remove_node(adjacency, name)
+                _add_route(adjacency, a, b, da + db)
+                parent[name] = (a, da) if da <= db else (b, db)
+                changed = True
+            elif merge_km > 0 and len(neighbours) > 0:
+                nearest, dn = min(neighbours.items(), key=lambda item: item[1])
+                if dn > merge_km:
+                    continue
+                others = [(other, d) for other, d in neighbours.items() if other != nearest]
+                _remove_node(adjacency, name)
+                for other, d in others:
+                    _add_route(adjacency, nearest, other, d + dn)
+                population[nearest] += population[name]
+                parent[name] = (nearest, dn)
+                changed = True
+
+    mapping = {}
+    for row in locations:
+        name, distance = row[0], 0.0
+        while name in parent:
+            name, step = parent[name]
+            distance += step
+        mapping[row[0]] = (name, distance)
+
+    coarse_locations = []
+    for row in locations:
+        if row[0] in adjacency:
+            row = list(row)
+            if len(row) > 7 and row[7].strip():
+                row[7] = str(int(round(population[row[0]])))
+            coarse_locations.append(row)
+
+    coarse_routes = []
+    for a in adjacency:
+        for b, distance in adjacency[a].items():
+            if a < b:
+                coarse_routes.append((a, b, distance))
+    return coarse_locations, coarse_routes, mapping
+
+
+def kept_locations(locations, routes, closures, conflict_names, min_population=0):
+    """
+    Locations that must stay: camps, conflict zones and forwarding hubs,
+    locations named in conflicts.csv or in location closures, ends of forced
+    routes, towns on a border (with a neighbour in another country), and towns
+    of at least <min_population> when that is given.
+    """
+    country = {row[0]: row[2].strip() for row in locations}
+    kept = set(conflict_names)
+    for row in locations:
+        if row[5].strip() in KEPT_TYPES:
+            kept.add(row[0])
+        if min_population > 0 and len(row) > 7 and row[7].strip() and float(row[7]) >= min_population:
+            kept.add(row[0])
+    for row in closures:
+        if row[0].strip() == "location":
+            kept.update((row[1].strip(), row[2].strip()))
+    for row in routes:
+        a, b = row[0].strip(), row[1].strip()
+        if len(row) > 3 and row[3].strip() not in ("", "0"):
+            kept.update((a, b))
+        if country.get(a) != country.get(b):
+            kept.update((a, b))
+    return kept
+
+
+def coarsen_scenario(scenario_path, output_path=None, merge_km=0.0, min_population=0):
+    """
+    Write a coarse copy of a scenario to <output_path> (or coarsen it in place),
+    with a coarse_map.csv in input_csv/ that maps each original location to its
+    super-node and the route distance between them. Camps keep their names, so
+    camp outputs are reported against the original camps.
+    """
+    if output_path is not None and os.path.abspath(output_path) != os.path.abspath(scenario_path):
+        shutil.copytree(scenario_path, output_path, dirs_exist_ok=True)
+        scenario_path = output_path
+    input_path = os.path.join(scenario_path, "input_csv")
+
+    location_header, locations = _read_csv(os.path.join(input_path, "locations.csv"))
+    route_header, routes = _read_csv(os.path.join(input_path, "routes.csv"))
+    _, closures = _read_csv(os.path.join(input_path, "closures.csv"))
+    conflict_header, _ = _read_csv(os.path.join(input_path, "conflicts.csv"))
+    locations = [[value.strip() for value in row] for row in locations]
+    conflict_names = [name.strip() for name in conflict_header[0][1:]] if len(conflict_header) > 0 else []
+
+    kept = kept_locations(locations, routes, closures, conflict_names, min_population)
+    forced = {
+        frozenset((row[0].strip(), row[1].strip())): row[3].strip()
+        for row in routes if len(row) > 3
+    }
+    coarse_locations, coarse_routes, mapping = coarsen(
+        locations, [(row[0].strip(), row[1].strip(), row[2]) for row in routes], kept, merge_km
+    )
+
+    _write_csv(os.path.join(input_path, "locations.csv"), location_header, coarse_locations)
+    _write_csv(
+        os.path.join(input_path, "routes.csv"),
+        route_header,
+        [[a, b, "%g" % distance, forced.get(frozenset((a, b)), "0")] for a, b, distance in coarse_routes],
+    )
+    _write_csv(
+        os.path.join(input_path, MAPPING_FILE),
+        [["#name", "super_node", "distance"]],
+        [[name, node, "%g" % distance] for name, (node, distance) in mapping.items()],
+    )
+    return len(locations), len(coarse_locations)
+
+
+def read_mapping(scenario_path):
+    """{original location: (super-node, distance)} of a coarsened scenario."""
+    _, rows = _read_csv(os.path.join(scenario_path, "input_csv", MAPPING_FILE))
+    return {row[0]: (row[1], float(row[2])) for row in rows}
+
+
+if __name__ == "__main__":
+    import argparse
+
+    arg_parser = argparse.ArgumentParser(
+        description="Collapse minor towns of a scenario into super-nodes, keeping camps and conflict zones."
+    )
+    arg_parser.add_argument("scenario_path", type=str, help="Path to the directory that contains the scenario")
+    arg_parser.add_argument("output_path", type=str, help="Directory for the coarse scenario")
+    arg_parser.add_argument("--merge-km", type=float, default=0.0, help="Also merge minor towns into a neighbour closer than this.")
+    arg_parser.add_argument("--min-population", type=float, default=0, help="Keep towns of at least this population.")
+    args = arg_parser.parse_args()
+
+    before, after = coarsen_scenario(args.scenario_path, args.output_path, args.merge_km, args.min_population)
+    print("%d -> %d locations: %s" % (before, after, args.output_path))
@@ -0,0 +1,136 @@
+import numpy as np
+
+from .engine import Engine
+
+
+class CohortEngine(Engine):
+    """
+    Count-based agent engine.
+
+    Agents that sit at the same location, or on the same link within the same
+    distance bucket, follow the same rules, so only their numbers are kept:
+    counts per location and per (link, distance bucket), each split by whether
+    the agents have arrived anywhere yet (they travel at MaxWalkSpeed until
+    they do, with StartOnFoot). Each day the leavers of a location are a
+    binomial draw with its move chance, and a group choosing between routes is
+    split with a multinomial draw over the route weights, so the cost of a day
+    depends on the network size and not on the number of refugees.
+
+    Agents on a link are grouped into buckets of <bucket_km> kilometres, and
+    each bucket keeps the mean position of its agents, so a bucket does not
+    fall behind its agents when they move on.
+    """
+
+    def __init__(self, e, bucket_km=5.0):
+        super().__init__(e)
+        self.bucket_km = float(bucket_km)
+        num_buckets = np.maximum(1, np.ceil(self.link_distance / self.bucket_km).astype(np.int64))
+        self.bucket_offsets = np.zeros(len(num_buckets) + 1, dtype=np.int64)
+        np.cumsum(num_buckets, out=self.bucket_offsets[1:])
+        self.bucket_link = np.repeat(np.arange(len(num_buckets)), num_buckets)
+
+        # Row 0: agents that have not arrived anywhere yet; row 1: the others.
+        self.at_location = np.zeros((2, self.num_locations), dtype=np.int64)
+        self.in_transit = np.zeros((2, self.bucket_offsets[-1]), dtype=np.int64)
+        self.transit_position = np.zeros((2, self.bucket_offsets[-1]))  # mean km travelled on the link
+
+    def _append(self, location_index, number):
+        self.at_location[0, location_index] += number
+        self.location_counts[location_index] += number
+
+    def num_local_agents(self):
+        return int(self.at_location.sum() + self.in_transit.sum())
+
+    def _place(self, link, arrived, number, position, budget, groups):
+        """Put <number> agents at <position> on <link> and move them <budget> further."""
+        position += budget
+        if position < self.link_distance[link]:
+            bucket = self.bucket_offsets[link] + min(int(position // self.bucket_km), self.bucket_offsets[link + 1] - self.bucket_offsets[link] - 1)
+            total = self.in_transit[arrived, bucket] + number
+            self.transit_position[arrived, bucket] += (position - self.transit_position[arrived, bucket]) * number / total
+            self.in_transit[arrived, bucket] = total
+        else:
+            self.link_traversals[link] += number
+            groups.append((self.link_end[link], number, position - self.link_distance[link]))
+
+    def _depart(self, location, arrived, number, budget, weights, groups):
+        """Split a group leaving <location> over its open routes and start them travelling."""
+        first, last = self.link_offsets[location], self.link_offsets[location + 1]
+        route_weights = weights[first:last]
+        total = route_weights.sum()
+        if total <= 0:
+            self.at_location[arrived, location] += number
+            return
+        for i, count in enumerate(np.random.multinomial(number, route_weights / total)):
+            if count > 0:
+                self._place(first + i, arrived, count, 0.0, budget, groups)
+
+    def evolve(self):
+        """Move the agent counts on this rank through one simulated day."""
+        movechance, stops, weights = self._geography()
+        speeds = self._speeds()
+
+        # Leavers are drawn before anyone travels, as only idle agents decide to move.
+        leavers = np.random.binomial(self.at_location, movechance[np.newaxis, :])
+        self.at_location -= leavers
+
+        # Groups reaching a location today: (location, number, distance left).
+        groups = []
+
+        for arrived in (0, 1):
+            budget = speeds[arrived]
+            counts = self.in_transit[arrived].copy()
+            occupied = np.nonzero(counts)[0]
+            new_positions = self.transit_position[arrived, occupied] + budget
+            links = self.bucket_link[occupied]
+            reached = new_positions >= self.link_distance[links]
+
+            moved = np.zeros_like(counts)
+            moved_distance = np.zeros(len(counts))
+            on_link = occupied[~reached]
+            buckets = self.bucket_offsets[links[~reached]] + np.minimum(
+                (new_positions[~reached] // self.bucket_km).astype(np.int64),
+                self.bucket_offsets[links[~reached] + 1] - self.bucket_offsets[links[~reached]] - 1,
+            )
+            np.add.at(moved, buckets, counts[on_link])
+            np.add.at(moved_distance, buckets, counts[on_link] * new_positions[~reached])
+            self.in_transit[arrived] = moved
+            self.transit_position[arrived] = np.divide(moved_distance, moved, out=np.zeros(len(counts)), where=moved > 0)
+
+            np.add.at(self.link_traversals, links[reached], counts[occupied[reached]])
+            for i in np.nonzero(reached)[0]:
+                groups.append((self.link_end[links[i]], counts[occupied[i]], new_positions[i] - self.link_distance[links[i]]))
+
+            for location in np.nonzero(leavers[arrived])[0]:
+                self._depart(location, arrived, leavers[arrived, location], budget, weights, groups)
+
+        # Agents passing through a town keep going while they have distance left.
+        for _ in range(self.num_locations + 1):
+            if len(groups) == 0:
+                break
+            reaching, groups = groups, []
+            for location, number, budget in reaching:
+                if budget > 0 and not stops[location]:
+                    self._depart(location, 1, number, budget, weights, groups)
+                else:
+                    self.at_location[1, location] += number
+        for location, number, budget in groups:
+            self.at_location[1, location] += number
+
+        self.location_counts = self.at_location.sum(axis=0)
+
+    def state_arrays(self):
+        """Cohort counts for checkpoints."""
+        return {
+            "engine_at_location": self.at_location,
+            "engine_in_transit": self.in_transit,
+            "engine_transit_position": self.transit_position,
+            **self._shared_state_arrays(),
+        }
+
+    def load_state_arrays(self, state):
+        self.at_location[:] = state["engine_at_location"]
+        self.in_transit[:] = state["engine_in_transit"]
+        self.transit_position[:] = state["engine_transit_position"]
+        self._load_shared_state_arrays(state)
+        self.location_counts = self.at_location.sum(axis=0)
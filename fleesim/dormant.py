@@ -0,0 +1,85 @@
+import numpy as np
+
+from .insertion import local_share, take_from_population
+from .person import Person
+
+
+def depart(a):
+    """
+    Start agent <a> on a route out of its location: the departure step of
+    Person.evolve() without the move chance draw, which the caller has made.
+    Agents without an open route stay where they are. The location scores the
+    route choice reads must be initialised (see DormantPopulation.release()).
+    """
+    route = a.selectRoute()
+    if route < 0:
+        return
+    link = a.location.links[route]
+    if getattr(link, "closed", False) or link in a.location.closed_links:
+        return
+    a.location.DecrementNumAgents()
+    a.location = link
+    a.location.IncrementNumAgents()
+    a.travelling = True
+    a.distance_travelled_on_link = 0
+
+
+class DormantPopulation:
+    """
+    Agents that have not moved since they were placed, held as counts per
+    location instead of Person objects.
+
+    Meant for the refugees already registered in the camps on day 0, who rarely
+    move. They are included in the location counts (numAgentsOnRank) and in
+    e.total_agents like any other agent. Each day a binomial draw with the
+    location's move chance decides how many of them leave; only those are made
+    into Person objects and sent on their way.
+    """
+
+    def __init__(self, e):
+        self.e = e
+        self.location_ids = {id(loc): i for i, loc in enumerate(e.locations)}
+        self.counts = np.zeros(len(e.locations), dtype=np.int64)
+        self.scores_ready = False
+
+    def add(self, location, number):
+        """Place <number> dormant agents at <location>; this rank keeps its share of them."""
+        number = int(number)
+        if number <= 0:
+            return
+        take_from_population(location, number)
+        num_local = local_share(self.e.total_agents + 1, number, self.e.mpi.rank, self.e.mpi.size)
+        self.e.total_agents += number
+        self.counts[self.location_ids[id(location)]] += num_local
+        location.numAgentsOnRank += num_local
+
+    def release(self):
+        """Materialize the dormant agents that leave today and start them travelling. Returns their number."""
+        occupied = np.nonzero(self.counts)[0]
+        if len(occupied) == 0:
+            return 0
+        if self.e.time == 0 and not self.scores_ready:
+            # Released before the first evolve(), which is where pflee
+            # initialises the location scores: do that here first, the same
+            # way (three rounds), on every location of every rank alike.
+            for _ in range(3):
+                for loc in self.e.locations:
+                    loc.updateAllScores(self.e.time)
+            self.scores_ready = True
+        movechance = np.array([float(self.e.locations[i].movechance) for i in occupied])
+        leaving = np.random.binomial(self.counts[occupied], movechance)
+        for i, number in zip(occupied[leaving > 0], leaving[leaving > 0]):
+            loc = self.e.locations[i]
+            self.counts[i] -= number
+            loc.numAgentsOnRank -= number
+            for _ in range(number):
+                a = Person(self.e, loc)
+                self.e.agents.append(a)
+                depart(a)
+        return int(leaving.sum())
+
+    def load(self, counts):
+        """Restore the counts from a checkpoint, on a freshly built Ecosystem."""
+        self.counts[:] = counts
+        for loc, number in zip(self.e.locations, self.counts):
+            loc.numAgentsOnRank += int(number)
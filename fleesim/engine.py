@@ -0,0 +1,135 @@
+import numpy as np
+from flee.SimulationSettings import SimulationSettings
+
+from .flows import link_table
+from .insertion import local_share, take_from_population
+
+
+def uses_forced_redirection(e):
+    """Whether any route of <e> has forced_redirection set, or a closure toggles it."""
+    for loc in e.locations:
+        for link in loc.links + loc.closed_links:
+            if getattr(link, "forced_redirection", False):
+                return True
+    return any(c[0] == "remove_forced_redirection" for c in e.closures)
+
+
+class Engine:
+    """
+    Common part of the array-based agent engines.
+
+    The flee Ecosystem still holds the geography: conflict zones, closures,
+    move chances and location scores. An engine replaces its Person objects
+    with its own representation of the agents, and moves them one day at a
+    time in evolve().
+
+    As in pflee, agent k lives on rank k % size, so every rank holds its own
+    share of the agents and only the camp counts need to be gathered.
+    Subclasses implement _append(), evolve(), num_local_agents(),
+    state_arrays() and load_state_arrays().
+
+    Forced redirection routes are not modelled, so scenarios that use them
+    raise a ValueError rather than quietly giving different flows from pflee.
+    """
+
+    def __init__(self, e):
+        if uses_forced_redirection(e):
+            raise ValueError("%s does not model forced_redirection routes; use the pflee engine" % type(self).__name__)
+        self.e = e
+        self.rank = e.mpi.rank
+        self.size = e.mpi.size
+        self.locations = e.locations
+        self.location_ids = {id(loc): i for i, loc in enumerate(e.locations)}
+        self.num_locations = len(e.locations)
+        self.is_camp = np.array([bool(loc.camp) for loc in e.locations], dtype=bool)
+
+        # Fixed table of all links (open or closed), grouped by start location.
+        self.link_objects, self.link_start, self.link_end = link_table(e)
+        self.link_ids = {id(link): i for i, link in enumerate(self.link_objects)}
+        self.link_distance = np.array([float(l.distance) for l in self.link_objects])
+        self.link_offsets = np.zeros(self.num_locations + 1, dtype=np.int64)
+        np.cumsum(np.bincount(self.link_start, minlength=self.num_locations), out=self.link_offsets[1:])
+
+        self.location_counts = np.zeros(self.num_locations, dtype=np.int64)
+        self.link_traversals = np.zeros(len(self.link_objects), dtype=np.int64)  # cumulative arrivals per link
+        self.total_agents = 0
+        self.reseed()
+
+    def reseed(self, seed=None):
+        """
+        Seed the stream used for the per-zone arrival counts. It has to be the
+        same on every rank, so that conflict-zone populations stay in step.
+        """
+        if seed is None:
+            seed = np.random.randint(2 ** 31) if self.rank == 0 else None
+            seed = self.e.mpi.comm.bcast(seed, root=0) if self.size > 1 else seed
+        self.shared_rng = np.random.RandomState(seed)
+
+    def add_agents(self, location, number):
+        """Add <number> agents at <location>; this rank keeps its share of them."""
+        number = int(number)
+        if number <= 0:
+            return
+        take_from_population(location, number)
+        num_local = local_share(self.total_agents + 1, number, self.rank, self.size)
+        self.total_agents += number
+        if num_local > 0:
+            self._append(self.location_ids[id(location)], num_local)
+
+    def add_agents_to_conflict_zones(self, number):
+        """
+        Spread <number> new agents over the conflict zones with one multinomial
+        draw over the conflict weights (identical on every rank).
+        """
+        number = int(number)
+        if number <= 0:
+            return
+        assert self.e.conflict_pop > 0
+        counts = self.shared_rng.multinomial(number, self.e.conflict_weights / self.e.conflict_pop)
+        for zone, count in zip(self.e.conflict_zones, counts):
+            if count > 0:
+                self.add_agents(zone, count)
+
+    def num_agents(self):
+        return self.total_agents
+
+    def camp_counts(self, camp_indices):
+        """Agents at each of the given locations, on this rank."""
+        return self.location_counts[camp_indices]
+
+    def _geography(self):
+        """Current move chances, stop flags and route weights from the Ecosystem."""
+        movechance = np.array([float(loc.movechance) for loc in self.locations])
+        stops = np.array([bool(loc.camp or loc.conflict) for loc in self.locations])
+
+        is_open = np.zeros(len(self.link_objects), dtype=bool)
+        for loc in self.locations:
+            for link in loc.links:
+                is_open[self.link_ids[id(link)]] = True
+
+        awareness = SimulationSettings.AwarenessLevel
+        if awareness <= 0:
+            weights = is_open.astype(float)
+        else:
+            scores = np.asarray(self.e.scores).reshape(-1, self.e.scores_per_location)[:, awareness]
+            weights = np.where(is_open, scores[self.link_end] / (SimulationSettings.Softening + self.link_distance), 0.0)
+        return movechance, stops, weights
+
+    def _speeds(self):
+        """Daily travel distance of agents that have not yet arrived anywhere, and of the others."""
+        move = float(SimulationSettings.MaxMoveSpeed)
+        walk = float(SimulationSettings.MaxWalkSpeed) if SimulationSettings.StartOnFoot else move
+        return walk, move
+
+    def _shared_state_arrays(self):
+        state = self.shared_rng.get_state()
+        return {
+            "engine_total_agents": np.array(self.total_agents),
+            "engine_rng_keys": state[1],
+            "engine_rng_params": np.array(state[2:], dtype=float),
+        }
+
+    def _load_shared_state_arrays(self, state):
+        self.total_agents = int(state["engine_total_agents"])
+        pos, has_gauss, cached_gaussian = state["engine_rng_params"]
+        self.shared_rng.set_state(("MT19937", state["engine_rng_keys"], int(pos), int(has_gauss), cached_gaussian))
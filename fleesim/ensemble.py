@@ -0,0 +1,58 @@
+import os
+import random
+import sys
+
+import numpy as np
+
+
+def reseed():
+    """Reseed the numpy and Python RNGs from the OS; returns the seed."""
+    seed = int.from_bytes(os.urandom(4), "little")
+    np.random.seed(seed)
+    random.seed(seed)
+    return seed
+
+
+def fork_members(num_members, concurrency=None):
+    """
+    Fork <num_members> children from the current (warm) process state, with at
+    most <concurrency> running at once. Like os.fork(), this returns twice:
+    each child gets its member index after reseeding its RNGs, while the parent
+    gets None once every child has exited, along with the indices that failed.
+
+    The process must not have initialised MPI (see fleesim.serial).
+    """
+    concurrency = concurrency or os.cpu_count() or 1
+    running = {}
+    failed = []
+
+    def reap():
+        pid, status = os.wait()
+        member = running.pop(pid)
+        if status != 0:
+            failed.append(member)
+
+    for member in range(num_members):
+        while len(running) >= concurrency:
+            reap()
+
+        sys.stdout.flush()
+        sys.stderr.flush()
+        pid = os.fork()
+        if pid == 0:
+            seed = reseed()
+            print("Ensemble member %d started with seed %d." % (member, seed), file=sys.stderr)
+            return member, []
+        running[pid] = member
+
+    while running:
+        reap()
+
+    return None, sorted(failed)
+
+
+def exit_member(status=0):
+    """End a forked member without running the parent's exit handlers."""
+    sys.stdout.flush()
+    sys.stderr.flush()
+    os._exit(status)
@@ -0,0 +1,112 @@
+import os
+
+import numpy as np
+from mpi4py import MPI
+
+from .person import Person
+
+
+FLOWS_FILE = "flows.npz"
+
+
+def link_table(e):
+    """All links of the Ecosystem (open or closed), grouped by start location, with start and end indices."""
+    location_ids = {id(loc): i for i, loc in enumerate(e.locations)}
+    links = []
+    for loc in e.locations:
+        links.extend(loc.links + loc.closed_links)
+    start = np.array([location_ids[id(l.startpoint)] for l in links], dtype=np.int32)
+    end = np.array([location_ids[id(l.endpoint)] for l in links], dtype=np.int32)
+    return links, start, end
+
+
+class FlowRecorder:
+    """
+    Daily occupancy of every location and traversal counts of every link.
+
+    Collects two int32 matrices: days x locations (agents at each location at
+    the end of the day) and days x links (agents that reached the end of each
+    link during the day). Both are summed onto rank 0 and written as one .npz
+    file at the end of the run.
+
+    Traversals are counted as agents move: the array engines keep cumulative
+    per-link arrival counters, and pflee agents (fleesim.person.Person)
+    report each link they complete to this recorder.
+    """
+
+    def __init__(self, e, num_days, engine=None):
+        self.e = e
+        self.engine = engine
+        self.links, self.link_start, self.link_end = link_table(e)
+        self.link_ids = {id(link): i for i, link in enumerate(self.links)}
+        self.occupancy = np.zeros((num_days, len(e.locations)), dtype=np.int32)
+        self.traversals = np.zeros((num_days, len(self.links)), dtype=np.int32)
+
+        if engine is not None:
+            self.last_traversals = engine.link_traversals.copy()
+        else:
+            self.day_traversals = np.zeros(len(self.links), dtype=np.int32)
+            Person.link_done = self._link_done
+
+    def _link_done(self, link):
+        self.day_traversals[self.link_ids[id(link)]] += 1
+
+    def day_done(self, t):
+        if self.engine is not None:
+            self.occupancy[t] = np.rint(self.engine.location_counts)
+            traversals = self.engine.link_traversals
+            self.traversals[t] = np.rint(traversals - self.last_traversals)
+            self.last_traversals = traversals.copy()
+            return
+
+        self.occupancy[t] = np.fromiter(
+            (loc.numAgentsOnRank for loc in self.e.locations), dtype=np.int32, count=len(self.e.locations)
+        )
+        self.traversals[t] = self.day_traversals
+        self.day_traversals[:] = 0
+
+    def state_arrays(self, day):
+        """The days before <day> recorded on this rank, for checkpoints."""
+        return {"flows_occupancy": self.occupancy[:day], "flows_traversals": self.traversals[:day]}
+
+    def load_state_arrays(self, state, day):
+        self.occupancy[:day] = state["flows_occupancy"]
+        self.traversals[:day] = state["flows_traversals"]
+        if self.engine is not None:
+            self.last_traversals = self.engine.link_traversals.copy()
+
+    def close(self, path):
+        """Sum the matrices over the ranks and write them to <path> on rank 0."""
+        if self.engine is None:
+            Person.link_done = None
+        comm = self.e.mpi.comm
+        occupancy, traversals = self.occupancy, self.traversals
+        if comm.Get_size() > 1:
+            occupancy = np.empty_like(self.occupancy) if self.e.mpi.rank == 0 else None
+            traversals = np.empty_like(self.traversals) if self.e.mpi.rank == 0 else None
+            comm.Reduce(self.occupancy, occupancy, op=MPI.SUM, root=0)
+            comm.Reduce(self.traversals, traversals, op=MPI.SUM, root=0)
+        if self.e.mpi.rank != 0:
+            return
+
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        np.savez_compressed(
+            path,
+            occupancy=occupancy,
+            traversals=traversals,
+            location_names=np.array([loc.name for loc in self.e.locations], dtype=str),
+            link_start=self.link_start,
+            link_end=self.link_end,
+        )
+
+
+def read_flows(path):
+    """Returns (location_names, link_start, link_end, occupancy, traversals) from a flows file."""
+    with np.load(path) as f:
+        return (
+            [str(name) for name in f["location_names"]],
+            f["link_start"],
+            f["link_end"],
+            f["occupancy"],
+            f["traversals"],
+        )
@@ -0,0 +1,66 @@
+import sys
+
+import numpy as np
+from flee.SimulationSettings import SimulationSettings
+
+from .person import Person
+
+
+def take_from_population(location, number):
+    """Population bookkeeping of Ecosystem.addAgent() for <number> agents spawned at <location>."""
+    if SimulationSettings.TakeRefugeesFromPopulation and location.conflict:
+        if location.pop <= number:
+            print(
+                "ERROR: Number of agents in the simulation is larger than the combined "
+                "population of the conflict zones. Please amend locations.csv.",
+                file=sys.stderr,
+            )
+            location.print()
+            assert location.pop > number
+        location.pop -= number
+        location.numAgentsSpawned += number
+
+
+def local_share(first, number, rank, size):
+    """How many of the agents numbered first..first+number-1 live on <rank> (agent k lives on rank k % size)."""
+    offset = (rank - first) % size
+    return len(range(first + offset, first + number, size))
+
+
+def add_agents(e, location, number):
+    """
+    Add <number> agents to <location> in one call.
+
+    Mirrors pflee.Ecosystem.addAgent(): the global agent counter advances by
+    <number>, but only the agents owned by this rank (agent k lives on rank
+    k % size) are turned into Person objects.
+    """
+    number = int(number)
+    if number <= 0:
+        return
+
+    take_from_population(location, number)
+
+    num_local = local_share(e.total_agents + 1, number, e.mpi.rank, e.mpi.size)
+    e.total_agents += number
+
+    e.agents.extend(Person(e, location) for _ in range(num_local))
+
+
+def add_agents_to_conflict_zones(e, number):
+    """
+    Spread <number> new agents over the conflict zones using a single
+    multinomial draw over the conflict weights, then insert each group in one
+    call. Equivalent in distribution to calling
+    e.addAgent(e.pick_conflict_location()) <number> times.
+    """
+    number = int(number)
+    if number <= 0:
+        return
+
+    assert e.conflict_pop > 0
+    counts = np.random.multinomial(number, e.conflict_weights / e.conflict_pop)
+
+    for zone, count in zip(e.conflict_zones, counts):
+        if count > 0:
+            add_agents(e, zone, count)
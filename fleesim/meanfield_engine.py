@@ -0,0 +1,200 @@
+import numpy as np
+from scipy import sparse
+
+from .engine import Engine
+from .insertion import take_from_population
+
+
+class MeanFieldEngine(Engine):
+    """
+    Deterministic expected-value engine for fast screening runs.
+
+    The state is the expected number of agents per location and per (link,
+    distance bucket), split like in the CohortEngine by whether the agents have
+    arrived anywhere yet. Where the cohort engine draws binomial and
+    multinomial numbers, this engine moves the expected fractions instead,
+    which makes a day a single product with a sparse transition matrix. The
+    matrix is rebuilt only when move chances, stop locations or route weights
+    change, i.e. on conflict and closure days.
+
+    Each of the two groups has its own buckets, of at most <bucket_km> and
+    sized to divide its daily travel distance, so the mass in a bucket moves
+    on by whole buckets. Mass entering a link part way through a day, after
+    passing through a town, is split over the two nearest bucket starts in
+    proportion to its distance from each, which keeps its mean position.
+
+    Camp counts are reported rounded to whole agents.
+    """
+
+    def __init__(self, e, bucket_km=5.0):
+        super().__init__(e)
+        self.bucket_km = []
+        self.bucket_offsets = []
+        self.bucket_link = []
+        self.bucket_position = []
+        self.bucket_first = []
+        first = 2 * self.num_locations
+        for speed in self._speeds():
+            km = speed / np.ceil(speed / bucket_km) if speed > 0 else float(bucket_km)
+            num_buckets = np.maximum(1, np.ceil(self.link_distance / km).astype(np.int64))
+            offsets = np.zeros(len(num_buckets) + 1, dtype=np.int64)
+            np.cumsum(num_buckets, out=offsets[1:])
+            link = np.repeat(np.arange(len(num_buckets)), num_buckets)
+            self.bucket_km.append(km)
+            self.bucket_offsets.append(offsets)
+            self.bucket_link.append(link)
+            self.bucket_position.append((np.arange(offsets[-1]) - offsets[link]) * km)
+            self.bucket_first.append(first)
+            first += int(offsets[-1])
+
+        # State vector: [not arrived | arrived] x locations, then the buckets of the not arrived and of the arrived.
+        self.state = np.zeros(first)
+        self.location_counts = np.zeros(self.num_locations)
+        self.link_traversals = np.zeros(len(self.link_objects))
+        self.transition = None
+        self.traversal = None
+        self.transition_key = None
+
+    def _location_state(self, arrived, location):
+        return arrived * self.num_locations + location
+
+    def _bucket_states(self, arrived, link, position):
+        """(state, fraction) of the buckets sharing mass at <position> on <link>."""
+        offsets = self.bucket_offsets[arrived]
+        first = self.bucket_first[arrived] + offsets[link]
+        last = offsets[link + 1] - offsets[link] - 1
+        bucket, offset = divmod(position, self.bucket_km[arrived])
+        bucket = int(bucket)
+        share = offset / self.bucket_km[arrived]
+        if bucket >= last or share < 1e-9:
+            return [(first + min(bucket, last), 1.0)]
+        if share > 1 - 1e-9:
+            return [(first + bucket + 1, 1.0)]
+        return [(first + bucket, 1.0 - share), (first + bucket + 1, share)]
+
+    def add_agents(self, location, number):
+        """Add an expected <number> of agents at <location>, shared evenly over the ranks."""
+        if number <= 0:
+            return
+        take_from_population(location, number)
+        self.total_agents += number
+        self.state[self._location_state(0, self.location_ids[id(location)])] += number / self.size
+
+    def add_agents_to_conflict_zones(self, number):
+        """Spread <number> new agents over the conflict zones in proportion to the conflict weights."""
+        if number <= 0:
+            return
+        assert self.e.conflict_pop > 0
+        for zone, share in zip(self.e.conflict_zones, number * self.e.conflict_weights / self.e.conflict_pop):
+            if share > 0:
+                self.add_agents(zone, share)
+
+    def num_agents(self):
+        return int(round(self.total_agents))
+
+    def num_local_agents(self):
+        return int(round(self.state.sum()))
+
+    def camp_counts(self, camp_indices):
+        return np.rint(self.location_counts[camp_indices]).astype(np.int64)
+
+    def _travel(self, source, arrived, link, fraction, position, budget, stops, weights, entries, traversed):
+        """
+        Follow <fraction> of the mass of state <source> that is at <position> on
+        <link> with <budget> km left today, appending (destination, source,
+        fraction) entries, and (link, source, fraction) for each link completed.
+        """
+        pending = [(arrived, link, fraction, position, budget)]
+        for _ in range(self.num_locations + 1):
+            if len(pending) == 0:
+                break
+            reaching = []
+            for arrived, link, fraction, position, budget in pending:
+                position += budget
+                if position < self.link_distance[link]:
+                    for state, share in self._bucket_states(arrived, link, position):
+                        entries.append((state, source, fraction * share))
+                else:
+                    traversed.append((link, source, fraction))
+                    reaching.append((self.link_end[link], fraction, position - self.link_distance[link]))
+            pending = []
+            for location, fraction, budget in reaching:
+                first, last = self.link_offsets[location], self.link_offsets[location + 1]
+                total = weights[first:last].sum()
+                if budget > 0 and not stops[location] and total > 0:
+                    # Passing through a town: keep going while there is distance left.
+                    for i in range(first, last):
+                        if weights[i] > 0:
+                            pending.append((1, i, fraction * weights[i] / total, 0.0, budget))
+                else:
+                    entries.append((self._location_state(1, location), source, fraction))
+        for arrived, link, fraction, position, budget in pending:
+            entries.append((self._location_state(1, self.link_end[link]), source, fraction))
+
+    def _build_transition(self, movechance, stops, weights):
+        speeds = self._speeds()
+        entries = []
+        traversed = []
+
+        for arrived in (0, 1):
+            for location in range(self.num_locations):
+                source = self._location_state(arrived, location)
+                first, last = self.link_offsets[location], self.link_offsets[location + 1]
+                total = weights[first:last].sum()
+                leave = movechance[location] if total > 0 else 0.0
+                entries.append((source, source, 1.0 - leave))
+                if leave > 0:
+                    for i in range(first, last):
+                        if weights[i] > 0:
+                            self._travel(source, arrived, i, leave * weights[i] / total, 0.0, speeds[arrived], stops, weights, entries, traversed)
+
+            # Buckets that stay on their link move on by whole buckets in one vectorized step.
+            offsets, bucket_link, bucket_position = self.bucket_offsets[arrived], self.bucket_link[arrived], self.bucket_position[arrived]
+            steps = int(round(speeds[arrived] / self.bucket_km[arrived]))
+            sources = self.bucket_first[arrived] + np.arange(len(bucket_link))
+            stays = bucket_position + speeds[arrived] < self.link_distance[bucket_link]
+            buckets = np.minimum(
+                np.arange(len(bucket_link))[stays] - offsets[bucket_link[stays]] + steps,
+                offsets[bucket_link[stays] + 1] - offsets[bucket_link[stays]] - 1,
+            )
+            entries.extend(zip(
+                self.bucket_first[arrived] + offsets[bucket_link[stays]] + buckets,
+                sources[stays],
+                np.ones(len(buckets)),
+            ))
+            for b in np.nonzero(~stays)[0]:
+                self._travel(sources[b], arrived, bucket_link[b], 1.0, bucket_position[b], speeds[arrived], stops, weights, entries, traversed)
+
+        size = len(self.state)
+        destination, source, fraction = zip(*entries)
+        transition = sparse.csr_matrix((fraction, (destination, source)), shape=(size, size))
+        traversal = sparse.csr_matrix((len(self.link_objects), size))
+        if len(traversed) > 0:
+            link, source, fraction = zip(*traversed)
+            traversal = sparse.csr_matrix((fraction, (link, source)), shape=(len(self.link_objects), size))
+        return transition, traversal
+
+    def evolve(self):
+        """Propagate the expected agent numbers on this rank through one simulated day."""
+        movechance, stops, weights = self._geography()
+        key = (movechance.tobytes(), stops.tobytes(), weights.tobytes())
+        if key != self.transition_key:
+            self.transition, self.traversal = self._build_transition(movechance, stops, weights)
+            self.transition_key = key
+        self.link_traversals += self.traversal @ self.state
+        self.state = self.transition @ self.state
+        self.location_counts = self.state[:self.num_locations] + self.state[self.num_locations:2 * self.num_locations]
+
+    def state_arrays(self):
+        """Expected agent numbers for checkpoints."""
+        return {
+            "engine_state": self.state,
+            "engine_total": np.array(self.total_agents, dtype=float),
+            **self._shared_state_arrays(),
+        }
+
+    def load_state_arrays(self, state):
+        self.state = np.array(state["engine_state"], dtype=float)
+        self._load_shared_state_arrays(state)
+        self.total_agents = float(state["engine_total"])
+        self.location_counts = self.state[:self.num_locations] + self.state[self.num_locations:2 * self.num_locations]
@@ -0,0 +1,76 @@
+import hashlib
+import os
+
+import numpy as np
+
+
+CACHE_DIR_NAME = "obs_cache"
+
+
+def cache_key(data_directory, corrections_file, camp_names, num_days, start_date, scaledown_factor):
+    """
+    Hash every input that the interpolated observations depend on: the CSVs
+    in the validation data directory, the registration corrections and the
+    parameters passed to the RefugeeTable.
+    """
+    h = hashlib.sha1()
+    for name in sorted(os.listdir(data_directory)):
+        path = os.path.join(data_directory, name)
+        if os.path.isfile(path):
+            h.update(name.encode())
+            with open(path, "rb") as f:
+                h.update(f.read())
+    if os.path.isfile(corrections_file):
+        with open(corrections_file, "rb") as f:
+            h.update(f.read())
+    h.update(repr((list(camp_names), int(num_days), start_date, scaledown_factor)).encode())
+    return h.hexdigest()[:16]
+
+
+def build_observations(d, camp_names, num_days):
+    """
+    Interpolate the UNHCR series held by RefugeeTable <d> once for all days.
+    Returns a (num_days, num_camps) matrix of camp observations and the vector
+    of daily differences in the total refugee count.
+    """
+    obs = np.zeros((num_days, len(camp_names)), dtype=np.int64)
+    for j, name in enumerate(camp_names):
+        for t in range(num_days):
+            obs[t, j] = d.get_field(name, t, FullInterpolation=True)
+
+    daily_difference = np.zeros(num_days, dtype=np.int64)
+    for t in range(num_days):
+        daily_difference[t] = d.get_daily_difference(t, FullInterpolation=True)
+
+    return obs, daily_difference
+
+
+def _save(path, array):
+    tmp_path = "%s.%d.tmp" % (path, os.getpid())
+    with open(tmp_path, "wb") as f:
+        np.save(f, array)
+    os.replace(tmp_path, path)
+
+
+def load_observations(data_directory, corrections_file, camp_names, num_days, start_date,
+                      scaledown_factor, make_table):
+    """
+    Return memory-mapped (observations, daily_difference) arrays for a run.
+
+    The arrays are cached in obs_cache/ next to <data_directory>, keyed by a
+    hash of the source CSVs, so they are only rebuilt when the inputs change.
+    <make_table> is called to construct the RefugeeTable on a cache miss.
+    """
+    data_directory = os.path.abspath(data_directory)
+    cache_dir = os.path.join(os.path.dirname(data_directory), CACHE_DIR_NAME)
+    key = cache_key(data_directory, corrections_file, camp_names, num_days, start_date, scaledown_factor)
+    obs_file = os.path.join(cache_dir, "%s.obs.npy" % key)
+    diff_file = os.path.join(cache_dir, "%s.diff.npy" % key)
+
+    if not (os.path.exists(obs_file) and os.path.exists(diff_file)):
+        obs, daily_difference = build_observations(make_table(), camp_names, num_days)
+        os.makedirs(cache_dir, exist_ok=True)
+        _save(obs_file, obs)
+        _save(diff_file, daily_difference)
+
+    return np.load(obs_file, mmap_mode="r"), np.load(diff_file, mmap_mode="r")
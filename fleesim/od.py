@@ -0,0 +1,135 @@
+import os
+
+import numpy as np
+from scipy import sparse
+
+from .person import Person
+
+
+OD_FILE = "od.npz"
+
+
+class ODRecorder:
+    """
+    Origin x destination counts of agents reaching a camp for the first time.
+
+    The origin is the location an agent was inserted at (its home location),
+    the destination the first camp it reaches, and the count is kept per time
+    bucket of <bucket_days> days (0: one bucket for the whole run) in a sparse
+    (bucket * origin) x camp matrix. Agents inserted at a camp are never
+    counted.
+
+    First camp arrivals are reported as they happen: by the VectorEngine, or
+    for pflee by the agents themselves (fleesim.person.Person).
+    """
+
+    def __init__(self, e, num_days, bucket_days=0, engine=None):
+        self.e = e
+        self.engine = engine
+        self.bucket_days = bucket_days
+        self.num_buckets = 1 if bucket_days <= 0 else (num_days + bucket_days - 1) // bucket_days
+        self.location_ids = {id(loc): i for i, loc in enumerate(e.locations)}
+        self.num_locations = len(e.locations)
+        self.camp_indices = np.array([i for i, loc in enumerate(e.locations) if loc.camp], dtype=np.int64)
+        self.camp_column = np.full(self.num_locations, -1, dtype=np.int64)
+        self.camp_column[self.camp_indices] = np.arange(len(self.camp_indices))
+        self.matrix = sparse.csr_matrix((self.num_buckets * self.num_locations, len(self.camp_indices)), dtype=np.int64)
+
+        if engine is not None:
+            engine.camp_arrivals = []
+        else:
+            self.day_arrivals = []  # (origin, camp) location indices
+            Person.first_camp_arrival = self._first_camp_arrival
+
+    def _first_camp_arrival(self, a):
+        self.day_arrivals.append((self.location_ids[id(a.home_location)], self.location_ids[id(a.location)]))
+
+    def _add(self, t, origins, destinations):
+        if len(origins) == 0:
+            return
+        bucket = 0 if self.bucket_days <= 0 else t // self.bucket_days
+        rows = bucket * self.num_locations + origins
+        self.matrix = self.matrix + sparse.csr_matrix(
+            (np.ones(len(origins), dtype=np.int64), (rows, self.camp_column[destinations])), shape=self.matrix.shape
+        )
+
+    def day_done(self, t):
+        if self.engine is not None:
+            arrivals = self.engine.camp_arrivals
+            if len(arrivals) > 0:
+                origins, destinations = (np.concatenate(a) for a in zip(*arrivals))
+                self._add(t, origins, destinations)
+            self.engine.camp_arrivals = []
+            return
+
+        if len(self.day_arrivals) > 0:
+            origins, destinations = np.array(self.day_arrivals, dtype=np.int64).T
+            self._add(t, origins, destinations)
+        self.day_arrivals = []
+
+    def state_arrays(self, day):
+        """The counts of this rank so far, for checkpoints."""
+        coo = sparse.coo_matrix(self.matrix)
+        return {"od_row": coo.row, "od_col": coo.col, "od_count": coo.data}
+
+    def load_state_arrays(self, state, day):
+        self.matrix = sparse.csr_matrix((state["od_count"], (state["od_row"], state["od_col"])), shape=self.matrix.shape)
+
+    def close(self, path):
+        """Sum the counts over the ranks and write them to <path> on rank 0."""
+        if self.engine is None:
+            Person.first_camp_arrival = None
+        comm = self.e.mpi.comm
+        matrices = [self.matrix]
+        if comm.Get_size() > 1:
+            matrices = comm.gather(self.matrix, root=0)
+        if self.e.mpi.rank != 0:
+            return
+        write_od(path, sum(matrices[1:], matrices[0]), self.num_locations, self.bucket_days,
+                 [loc.name for loc in self.e.locations], self.camp_indices)
+
+
+def write_od(path, matrix, num_locations, bucket_days, location_names, camp_indices):
+    coo = sparse.coo_matrix(matrix)
+    os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+    np.savez_compressed(
+        path,
+        bucket=(coo.row // num_locations).astype(np.int32),
+        origin=(coo.row % num_locations).astype(np.int32),
+        destination=np.asarray(camp_indices)[coo.col].astype(np.int32),
+        count=coo.data.astype(np.int64),
+        bucket_days=bucket_days,
+        location_names=np.array(location_names, dtype=str),
+    )
+
+
+def read_od(path):
+    """Returns (location_names, bucket_days, bucket, origin, destination, count) from an od.npz file."""
+    with np.load(path) as f:
+        return (
+            [str(name) for name in f["location_names"]],
+            int(f["bucket_days"]),
+            f["bucket"],
+            f["origin"],
+            f["destination"],
+            f["count"],
+        )
+
+
+def merge_od(paths, path):
+    """Sum the od.npz files of several ensemble members into <path>."""
+    parts = [read_od(p) for p in paths]
+    location_names, bucket_days = parts[0][:2]
+    bucket, origin, destination, count = (np.concatenate(column) for column in list(zip(*parts))[2:])
+    keys, inverse = np.unique(np.stack((bucket, origin, destination)), axis=1, return_inverse=True)
+    totals = np.bincount(inverse.ravel(), weights=count, minlength=keys.shape[1]).astype(np.int64)
+    os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+    np.savez_compressed(
+        path,
+        bucket=keys[0].astype(np.int32),
+        origin=keys[1].astype(np.int32),
+        destination=keys[2].astype(np.int32),
+        count=totals,
+        bucket_days=bucket_days,
+        location_names=np.array(location_names, dtype=str),
+    )
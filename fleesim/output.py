@@ -0,0 +1,110 @@
+import glob
+import os
+import queue
+import threading
+
+import numpy as np
+
+from .results import DATA, ERROR, GLOBAL_COLUMNS, SIM
+
+
+INDEX_FILE = "index.npz"
+
+
+class ResultWriter:
+    """
+    Writes the days recorded in a ResultBuffer to <directory> as compressed
+    .npz chunks of <chunk_days> days each. Files are written by a background
+    thread, so the simulation loop only pays for handing over a slice.
+
+    Each chunk holds long-format camp columns (day, camp, sim, data, error)
+    and the global totals for the same days.
+    """
+
+    def __init__(self, directory, res, chunk_days=100):
+        self.directory = directory
+        self.res = res
+        self.chunk_days = chunk_days
+        self.flushed = 0
+
+        os.makedirs(directory, exist_ok=True)
+        for old_chunk in glob.glob(os.path.join(directory, "days_*.npz")):
+            os.remove(old_chunk)
+        np.savez(
+            os.path.join(directory, INDEX_FILE),
+            camp_names=np.array(res.camp_names, dtype=str),
+            global_columns=np.array(GLOBAL_COLUMNS, dtype=str),
+        )
+
+        self.queue = queue.Queue()
+        self.thread = threading.Thread(target=self._run, daemon=True)
+        self.thread.start()
+
+    def _run(self):
+        while True:
+            item = self.queue.get()
+            if item is None:
+                return
+            start, camp, totals = item
+            num_days, num_camps = camp.shape[:2]
+            np.savez_compressed(
+                os.path.join(self.directory, "days_%06d.npz" % start),
+                day=np.repeat(np.arange(start, start + num_days, dtype=np.int32), num_camps),
+                camp=np.tile(np.arange(num_camps, dtype=np.int32), num_days),
+                sim=camp[:, :, SIM].astype(np.int64).ravel(),
+                data=camp[:, :, DATA].astype(np.int64).ravel(),
+                error=camp[:, :, ERROR].ravel(),
+                global_day=np.arange(start, start + num_days, dtype=np.int32),
+                totals=totals,
+            )
+
+    def flush(self, stop):
+        """Queue all recorded days before <stop> that have not been written."""
+        if stop > self.flushed:
+            self.queue.put((
+                self.flushed,
+                self.res.camp[self.flushed:stop].copy(),
+                self.res.totals[self.flushed:stop].copy(),
+            ))
+            self.flushed = stop
+
+    def day_done(self, t):
+        """Call after day <t> is recorded; writes a chunk once it is full."""
+        if t + 1 - self.flushed >= self.chunk_days:
+            self.flush(t + 1)
+
+    def close(self, stop=None):
+        self.flush(self.res.camp.shape[0] if stop is None else stop)
+        self.queue.put(None)
+        self.thread.join()
+
+
+def read_results(directory):
+    """
+    Load the chunks written by a ResultWriter.
+
+    Returns (camp_names, camp_columns, global_columns), where camp_columns maps
+    day/camp/sim/data/error to 1D arrays and global_columns maps "Day" and each
+    of GLOBAL_COLUMNS to 1D arrays.
+    """
+    with np.load(os.path.join(directory, INDEX_FILE)) as index:
+        camp_names = [str(name) for name in index["camp_names"]]
+        global_names = [str(name) for name in index["global_columns"]]
+
+    camp_parts = {key: [] for key in ("day", "camp", "sim", "data", "error")}
+    global_days = []
+    totals = []
+    for chunk_file in sorted(glob.glob(os.path.join(directory, "days_*.npz"))):
+        with np.load(chunk_file) as chunk:
+            for key in camp_parts:
+                camp_parts[key].append(chunk[key])
+            global_days.append(chunk["global_day"])
+            totals.append(chunk["totals"])
+
+    camp_columns = {key: np.concatenate(parts) for key, parts in camp_parts.items()}
+    totals = np.concatenate(totals)
+    global_columns = {"Day": np.concatenate(global_days)}
+    for i, name in enumerate(global_names):
+        # Only the total error is fractional; the other totals are counts.
+        global_columns[name] = totals[:, i] if i == 0 else totals[:, i].astype(np.int64)
+    return camp_names, camp_columns, global_columns
@@ -0,0 +1,34 @@
+from flee import pflee
+
+
+class Person(pflee.Person):
+    """
+    pflee Person that reports each link it reaches the end of, and the first
+    camp it reaches.
+
+    When Person.link_done is set (see flows.FlowRecorder), it is called with
+    the link every time an agent of this rank arrives at its endpoint, so link
+    flows are counted as agents move. When Person.first_camp_arrival is set
+    (see od.ODRecorder), it is called with the agent when it stops at a camp
+    for the first time; agents created at a camp count as having reached it.
+    fleesim creates its agents as this class.
+    """
+
+    __slots__ = ("reached_camp",)
+
+    link_done = None
+    first_camp_arrival = None
+
+    def __init__(self, e, location, *args, **kwargs):
+        super().__init__(e, location, *args, **kwargs)
+        self.reached_camp = bool(location.camp)
+
+    def finish_travel(self, *args, **kwargs):
+        link = self.location if self.travelling else None
+        super().finish_travel(*args, **kwargs)
+        if link is not None and self.location is not link and Person.link_done is not None:
+            Person.link_done(link)
+        if not self.reached_camp and not self.travelling and self.location is not None and self.location.camp:
+            self.reached_camp = True
+            if Person.first_camp_arrival is not None:
+                Person.first_camp_arrival(self)
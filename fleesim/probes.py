@@ -0,0 +1,193 @@
+import abc
+import importlib
+import os
+
+import numpy as np
+from mpi4py import MPI
+
+
+PROBES_FILE = "probes.npz"
+
+# Inputs a probe can ask for; each is computed at most once per day.
+NEEDS = ("camp_counts", "location_counts", "new_arrivals")
+
+PROBES = {}
+
+
+def register(cls):
+    """Class decorator that makes a Probe available to run_par.py --probe by its name."""
+    PROBES[cls.name] = cls
+    return cls
+
+
+class Probe(abc.ABC):
+    """
+    A custom per-day metric, sampled by the driver loop every <every> days.
+
+    Subclasses set <name>, the inputs they need (from NEEDS) and <dtype>, and
+    implement columns() and measure(). measure() sees the values of this rank
+    only and returns one row; the rows are summed over the ranks, so a probe
+    should measure additive quantities and derive anything else in finish(),
+    which runs on rank 0 on the merged (samples x columns) array.
+    """
+
+    name = None
+    needs = ()
+    dtype = np.int64
+
+    def __init__(self, every=1):
+        self.every = max(1, every)
+
+    @abc.abstractmethod
+    def columns(self, e, camps):
+        """Names of the columns measured, given the Ecosystem <e> and its <camps>."""
+
+    @abc.abstractmethod
+    def measure(self, t, inputs):
+        """The row of day <t> on this rank, from the <inputs> named in needs."""
+
+    def finish(self, values):
+        return values
+
+
+@register
+class CampTotal(Probe):
+    """Refugees in all camps."""
+
+    name = "camp_total"
+    needs = ("camp_counts",)
+
+    def columns(self, e, camps):
+        return ["refugees in camps"]
+
+    def measure(self, t, inputs):
+        return [inputs["camp_counts"].sum()]
+
+
+@register
+class LocationOccupancy(Probe):
+    """Refugees at every location."""
+
+    name = "location_counts"
+    needs = ("location_counts",)
+
+    def columns(self, e, camps):
+        return [loc.name for loc in e.locations]
+
+    def measure(self, t, inputs):
+        return inputs["location_counts"]
+
+
+@register
+class NewArrivals(Probe):
+    """Refugees inserted into the conflict zones."""
+
+    name = "new_arrivals"
+    needs = ("new_arrivals",)
+
+    def columns(self, e, camps):
+        return ["new refugees"]
+
+    def measure(self, t, inputs):
+        return [inputs["new_arrivals"]]
+
+
+def import_probe_modules(module_names):
+    """Import modules that define and register their own probes."""
+    for module_name in module_names:
+        importlib.import_module(module_name)
+
+
+def parse_probe(spec):
+    """Make a probe from "<name>" or "<name>:<every>"."""
+    name, _, every = spec.partition(":")
+    if name not in PROBES:
+        raise ValueError("Unknown probe %s (known: %s)" % (name, ", ".join(sorted(PROBES))))
+    return PROBES[name](int(every) if every else 1)
+
+
+class ProbeSet:
+    """
+    Runs the registered probes in the driver loop.
+
+    Every probe gets a preallocated (samples x columns) array for the days on
+    its cadence. Inputs are computed only on days when a probe that needs them
+    is due. Global inputs (new_arrivals) are given to rank 0 only, so that
+    summing over the ranks keeps them exact. At the end of the run the arrays
+    are summed onto rank 0 and written to a single .npz file.
+    """
+
+    def __init__(self, e, camps, num_days, probes, engine=None):
+        self.e = e
+        self.camps = camps
+        self.engine = engine
+        self.probes = probes
+        if engine is not None:
+            self.camp_indices = np.array([engine.location_ids[id(c)] for c in camps], dtype=np.int64)
+
+        self.columns = []
+        self.values = []
+        for probe in probes:
+            columns = probe.columns(e, camps)
+            self.columns.append(columns)
+            self.values.append(np.zeros(((num_days - 1) // probe.every + 1, len(columns)), dtype=probe.dtype))
+
+    def _input(self, need, new_arrivals):
+        if need == "camp_counts":
+            if self.engine is not None:
+                return self.engine.camp_counts(self.camp_indices)
+            return np.fromiter((c.numAgentsOnRank for c in self.camps), dtype=np.int64, count=len(self.camps))
+        if need == "location_counts":
+            if self.engine is not None:
+                return np.rint(self.engine.location_counts)
+            return np.fromiter((loc.numAgentsOnRank for loc in self.e.locations), dtype=np.int64, count=len(self.e.locations))
+        if need == "new_arrivals":
+            return new_arrivals if self.e.mpi.rank == 0 else 0
+        raise ValueError("Unknown probe input %s" % need)
+
+    def day_done(self, t, new_arrivals):
+        inputs = {}
+        for probe, values in zip(self.probes, self.values):
+            if t % probe.every != 0:
+                continue
+            for need in probe.needs:
+                if need not in inputs:
+                    inputs[need] = self._input(need, new_arrivals)
+            values[t // probe.every] = probe.measure(t, inputs)
+
+    def state_arrays(self, day):
+        """The samples of this rank before <day>, for checkpoints."""
+        return {
+            "probe_" + probe.name: values[: (day + probe.every - 1) // probe.every]
+            for probe, values in zip(self.probes, self.values)
+        }
+
+    def load_state_arrays(self, state, day):
+        for probe, values in zip(self.probes, self.values):
+            values[: (day + probe.every - 1) // probe.every] = state["probe_" + probe.name]
+
+    def close(self, path):
+        """Sum the samples over the ranks and write them to <path> on rank 0."""
+        comm = self.e.mpi.comm
+        arrays = {}
+        for probe, columns, values in zip(self.probes, self.columns, self.values):
+            if comm.Get_size() > 1:
+                merged = np.empty_like(values) if self.e.mpi.rank == 0 else None
+                comm.Reduce(values, merged, op=MPI.SUM, root=0)
+                values = merged
+            if self.e.mpi.rank == 0:
+                arrays[probe.name] = probe.finish(values)
+                arrays[probe.name + "_days"] = np.arange(len(values), dtype=np.int32) * probe.every
+                arrays[probe.name + "_columns"] = np.array(columns, dtype=str)
+        if self.e.mpi.rank != 0:
+            return
+
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        np.savez_compressed(path, **arrays)
+
+
+def read_probes(path):
+    """Returns {probe name: (days, columns, values)} from a probes file."""
+    with np.load(path) as f:
+        names = [key[:-len("_days")] for key in f.files if key.endswith("_days")]
+        return {name: (f[name + "_days"], [str(c) for c in f[name + "_columns"]], f[name]) for name in names}
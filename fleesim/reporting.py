@@ -0,0 +1,91 @@
+import numpy as np
+from mpi4py import MPI
+
+
+class Reporter:
+    """
+    Rank-aware reporting for pflee runs.
+
+    pflee's evolve() already leaves the global camp counts in numAgents on
+    every rank, so rank 0 reads them without any communication. Rank 0 alone
+    records the days into the ResultBuffer and owns the output: the
+    ResultWriter and/or the CSV rows printed to stdout.
+
+    With an <engine> (see fleesim.engine), each rank keeps the per-day camp
+    counts of its own agents, and these are summed onto rank 0 with a single
+    MPI Reduce per reporting interval.
+    """
+
+    def __init__(self, e, camps, res, obs, interval=1, writer=None, print_csv=True, engine=None):
+        self.e = e
+        self.camps = camps
+        self.engine = engine
+        if engine is not None:
+            self.camp_indices = np.array([engine.location_ids[id(c)] for c in camps], dtype=np.int64)
+        self.res = res
+        self.obs = obs
+        self.interval = max(1, interval)
+        self.writer = writer
+        self.print_csv = print_csv
+
+        self.comm = e.mpi.comm
+        self.rank = e.mpi.rank
+
+        self.local_counts = np.zeros((self.interval, len(camps)), dtype=np.int64)
+        self.pending = []  # (t, total agents, refugees_raw, refugee_debt) per unreported day
+
+    def start(self):
+        if self.print_csv and self.rank == 0:
+            print(self.res.header())
+
+    def local_camp_counts(self):
+        """Camp counts of this rank's agents with an engine, else the global pflee counts."""
+        if self.engine is not None:
+            return self.engine.camp_counts(self.camp_indices)
+        return np.fromiter(
+            (c.numAgents for c in self.camps), dtype=np.int64, count=len(self.camps)
+        )
+
+    def day_done(self, t, refugees_raw, refugee_debt):
+        self.local_counts[len(self.pending)] = self.local_camp_counts()
+        total_agents = self.e.numAgents() if self.engine is None else self.engine.num_agents()
+        self.pending.append((t, total_agents, refugees_raw, refugee_debt))
+        if len(self.pending) == self.interval:
+            self.flush()
+
+    def flush(self):
+        num_days = len(self.pending)
+        if num_days == 0:
+            return
+
+        block = self.local_counts[:num_days]
+        if self.engine is None or self.comm.Get_size() == 1:
+            # Already global, or nothing to gather.
+            totals = block
+        else:
+            totals = np.empty_like(block) if self.rank == 0 else None
+            self.comm.Reduce(block, totals, op=MPI.SUM, root=0)
+
+        if self.rank == 0:
+            for i, (t, total_agents, refugees_raw, refugee_debt) in enumerate(self.pending):
+                self.res.record(t, totals[i], self.obs[t], total_agents, refugees_raw, refugee_debt)
+                self._emit(t)
+
+        self.pending = []
+
+    def _emit(self, t):
+        if self.writer is not None:
+            self.writer.day_done(t)
+        if self.print_csv:
+            print(self.res.format_row(t))
+
+    def emit_restored(self, stop):
+        """Output the days before <stop>, restored from a checkpoint rather than simulated."""
+        if self.rank == 0:
+            for t in range(stop):
+                self._emit(t)
+
+    def close(self):
+        self.flush()
+        if self.writer is not None:
+            self.writer.close()
@@ -0,0 +1,78 @@
+import numpy as np
+
+
+# Matches flee.postprocessing.analysis.ROUND_NDIGITS
+ROUND_NDIGITS = 4
+
+SIM, DATA, ERROR = 0, 1, 2
+
+GLOBAL_COLUMNS = [
+    "Total error",
+    "refugees in camps (UNHCR)",
+    "total refugees (simulation)",
+    "raw UNHCR refugee count",
+    "refugees in camps (simulation)",
+    "refugee_debt",
+]
+
+
+def rel_errors(sim, data):
+    """Vectorized analysis.rel_error() over arrays of camp values."""
+    data = np.asarray(data, dtype=float)
+    with np.errstate(divide="ignore", invalid="ignore"):
+        errors = np.where(data < 0.00001, 0.0, np.abs(sim / data - 1.0))
+    return np.round(errors, ROUND_NDIGITS)
+
+
+def abs_errors(sim, data):
+    """Vectorized analysis.abs_error() over arrays of camp values."""
+    return np.round(np.abs(np.asarray(sim, dtype=float) - data), ROUND_NDIGITS)
+
+
+class ResultBuffer:
+    """
+    Preallocated per-day results of a run: a (days, camps, 3) array of
+    sim/data/error values and a (days, len(GLOBAL_COLUMNS)) array of totals.
+    """
+
+    def __init__(self, num_days, camp_names):
+        self.camp_names = list(camp_names)
+        self.camp = np.zeros((num_days, len(self.camp_names), 3))
+        self.totals = np.zeros((num_days, len(GLOBAL_COLUMNS)))
+
+    def record(self, t, sim, data, total_agents, refugees_raw, refugee_debt):
+        """Store day <t>, given camp populations <sim> and observations <data>."""
+        self.camp[t, :, SIM] = sim
+        self.camp[t, :, DATA] = data
+        self.camp[t, :, ERROR] = rel_errors(sim, data)
+
+        if refugees_raw > 0:
+            self.totals[t] = (
+                float(np.sum(abs_errors(sim, data))) / float(refugees_raw),
+                np.sum(data),
+                total_agents,
+                refugees_raw,
+                np.sum(sim),
+                refugee_debt,
+            )
+        else:
+            self.totals[t] = 0
+
+    def header(self):
+        header = "Day,"
+        for name in self.camp_names:
+            header += "%s sim,%s data,%s error," % (name, name, name)
+        return header + ",".join(GLOBAL_COLUMNS)
+
+    def format_row(self, t):
+        """Format day <t> as a row of the classic out.csv layout."""
+        output = "%s" % t
+        for sim, data, error in self.camp[t]:
+            output += ",%d,%d,%s" % (sim, data, float(error))
+
+        totals = self.totals[t]
+        if totals[3] > 0:
+            output += ",%s,%d,%d,%d,%d,%d" % (float(totals[0]), *totals[1:])
+        else:
+            output += ",0,0,0,0,0,0"
+        return output
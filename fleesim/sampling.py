@@ -0,0 +1,76 @@
+import random
+
+import numpy as np
+from flee.SimulationSettings import SimulationSettings
+
+
+class AliasTable:
+    """Walker's alias method: O(n) construction, O(1) per weighted draw."""
+
+    def __init__(self, weights):
+        weights = np.asarray(weights, dtype=float)
+        n = len(weights)
+        assert n > 0 and weights.sum() > 0
+        scaled = weights * n / weights.sum()
+
+        self.prob = np.ones(n)
+        self.alias = np.arange(n)
+        small = [i for i in range(n) if scaled[i] < 1.0]
+        large = [i for i in range(n) if scaled[i] >= 1.0]
+        while small and large:
+            s = small.pop()
+            l = large.pop()
+            self.prob[s] = scaled[s]
+            self.alias[s] = l
+            scaled[l] -= 1.0 - scaled[s]
+            (small if scaled[l] < 1.0 else large).append(l)
+        # Whatever is left is 1.0 up to rounding error.
+        self.prob_list = self.prob.tolist()
+        self.alias_list = self.alias.tolist()
+        self.n = n
+
+    def draw(self):
+        i = int(random.random() * self.n)
+        return i if random.random() < self.prob_list[i] else self.alias_list[i]
+
+    def draw_many(self, size):
+        i = np.random.randint(0, self.n, size=size)
+        return np.where(np.random.random(size) < self.prob[i], i, self.alias[i])
+
+
+class ConflictSampler:
+    """
+    Keeps the Ecosystem's conflict weights up to date with a dirty flag, and
+    draws conflict locations from an alias table built from those weights.
+
+    The weights go stale when the set of conflict zones changes, or when agents
+    are taken from the population of a conflict zone
+    (SimulationSettings.TakeRefugeesFromPopulation). Otherwise refresh() is free.
+    """
+
+    def __init__(self, e):
+        self.e = e
+        self.dirty = True
+        self.table = None
+
+    def conflicts_changed(self):
+        # add/remove_conflict_zone() already reshaped the weights; drop the table.
+        self.dirty = True
+        self.table = None
+
+    def agents_inserted(self, number):
+        if number > 0 and SimulationSettings.TakeRefugeesFromPopulation:
+            self.dirty = True
+
+    def refresh(self):
+        """Equivalent to e.refresh_conflict_weights(), but only when something changed."""
+        if self.dirty:
+            self.e.refresh_conflict_weights()
+            self.table = None
+            self.dirty = False
+
+    def pick(self):
+        """O(1) replacement for e.pick_conflict_location()."""
+        if self.table is None:
+            self.table = AliasTable(self.e.conflict_weights)
+        return self.e.conflict_zones[self.table.draw()]
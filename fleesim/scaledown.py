@@ -0,0 +1,40 @@
+import math
+
+import numpy as np
+
+
+def estimate_load(obs, daily_difference, num_days):
+    """
+    Expected (peak number of agents, agent-days) of an unscaled run, from the
+    day 0 camp observations and the daily differences in the total count that
+    run_par.py inserts.
+    """
+    arrivals = np.maximum(np.asarray(daily_difference[1:num_days], dtype=np.int64), 0)
+    agents = int(np.asarray(obs[0]).sum()) + np.concatenate(([0], np.cumsum(arrivals)))
+    return int(agents.max()), int(agents.sum())
+
+
+def choose_factor(peak_agents, agent_days, agent_budget=None, time_budget=None, agent_days_per_second=2e5):
+    """
+    The smallest integer PopulationScaledownFactor that keeps the peak agent
+    count within <agent_budget> and the estimated run time within
+    <time_budget> seconds (at <agent_days_per_second>). 1 without budgets.
+    """
+    factor = 1
+    if agent_budget:
+        factor = max(factor, math.ceil(peak_agents / agent_budget))
+    if time_budget:
+        factor = max(factor, math.ceil(agent_days / (time_budget * agent_days_per_second)))
+    return factor
+
+
+def sampling_noise(sim, factor):
+    """
+    Standard deviation estimate of rescaled counts factor * <sim>, where <sim>
+    counts agents that each stand for <factor> refugees: factor * sqrt(sim).
+    Zero for unscaled runs.
+    """
+    sim = np.asarray(sim, dtype=float)
+    if factor <= 1:
+        return np.zeros_like(sim)
+    return factor * np.sqrt(sim)
@@ -0,0 +1,97 @@
+import os
+
+import numpy as np
+from flee import pflee
+from mpi4py import MPI
+
+
+# Environment variables through which common MPI launchers pass the number of ranks.
+LAUNCHER_SIZE_VARIABLES = ("OMPI_COMM_WORLD_SIZE", "PMI_SIZE", "PMIX_SIZE", "MV2_COMM_WORLD_SIZE")
+
+
+def launched_ranks():
+    """Number of ranks this process was started with by mpirun, without initialising MPI."""
+    for name in LAUNCHER_SIZE_VARIABLES:
+        if name in os.environ:
+            return int(os.environ[name])
+    return 1
+
+
+def _buffer(spec):
+    """The NumPy array of an mpi4py buffer specification (array, or [array, datatype, ...])."""
+    if isinstance(spec, (list, tuple)):
+        spec = spec[0]
+    return np.asarray(spec)
+
+
+def _copy(sendbuf, recvbuf):
+    if sendbuf is MPI.IN_PLACE or recvbuf is None:
+        return
+    source = _buffer(sendbuf).reshape(-1)
+    _buffer(recvbuf).reshape(-1)[: source.size] = source
+
+
+class SerialComm:
+    """
+    Stand-in for MPI.COMM_WORLD in a single process that never initialises MPI.
+
+    Every collective of one rank reduces to a copy or to returning its input.
+    Covers the calls made by pflee and fleesim.
+    """
+
+    def Get_rank(self):
+        return 0
+
+    def Get_size(self):
+        return 1
+
+    def Barrier(self):
+        pass
+
+    def bcast(self, obj, root=0):
+        return obj
+
+    def Bcast(self, buf, root=0):
+        pass
+
+    def allreduce(self, obj, op=None):
+        return obj
+
+    def reduce(self, obj, op=None, root=0):
+        return obj
+
+    def gather(self, obj, root=0):
+        return [obj]
+
+    def allgather(self, obj):
+        return [obj]
+
+    def alltoall(self, objs):
+        return list(objs)
+
+    def Allreduce(self, sendbuf, recvbuf, op=None):
+        _copy(sendbuf, recvbuf)
+
+    def Reduce(self, sendbuf, recvbuf, op=None, root=0):
+        _copy(sendbuf, recvbuf)
+
+    def Allgather(self, sendbuf, recvbuf):
+        _copy(sendbuf, recvbuf)
+
+    def Allgatherv(self, sendbuf, recvbuf):
+        _copy(sendbuf, recvbuf)
+
+    def Gather(self, sendbuf, recvbuf, root=0):
+        _copy(sendbuf, recvbuf)
+
+    def Gatherv(self, sendbuf, recvbuf, root=0):
+        _copy(sendbuf, recvbuf)
+
+
+class SerialMPIManager(pflee.MPIManager):
+    """pflee's MPIManager on a SerialComm, for an Ecosystem that must not initialise MPI."""
+
+    def __init__(self):
+        self.comm = SerialComm()
+        self.rank = 0
+        self.size = 1
@@ -0,0 +1,27 @@
+import numpy as np
+
+from fleesim.assimilation import particle_weights, systematic_resample
+
+
+def test_particle_weights_normalised_and_ordered():
+    weights = particle_weights([0.1, 0.5, np.inf], sigma=0.2)
+    assert np.isclose(weights.sum(), 1.0)
+    assert weights[0] > weights[1] > weights[2] == 0.0
+
+
+def test_particle_weights_uniform_when_no_member_scored():
+    assert np.allclose(particle_weights([np.inf, np.nan, np.inf], sigma=1.0), 1.0 / 3)
+
+
+def test_systematic_resample():
+    np.random.seed(0)
+    indices = systematic_resample(np.full(4, 0.25), 4)
+    assert sorted(indices.tolist()) == [0, 1, 2, 3]
+
+    weights = np.array([0.0, 0.9, 0.1, 0.0])
+    for _ in range(20):
+        indices = systematic_resample(weights, 10)
+        assert len(indices) == 10
+        assert ((indices >= 0) & (indices < 4)).all()
+        assert (indices == 1).sum() == 9
+        assert set(indices.tolist()) <= {1, 2}
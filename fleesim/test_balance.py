@@ -0,0 +1,33 @@
+import numpy as np
+
+from fleesim.balance import imbalance, transfers
+
+
+def apply(counts, moves):
+    counts = np.array(counts)
+    for sender, receiver, number in moves:
+        assert number > 0
+        counts[sender] -= number
+        counts[receiver] += number
+    return counts
+
+
+def test_transfers_even_out_and_conserve():
+    for counts in ([10, 0, 2], [1, 1, 5], [0, 0, 0, 7], [3, 3, 3], [100, 1]):
+        moves = transfers(counts)
+        after = apply(counts, moves)
+        assert after.sum() == sum(counts)
+        assert after.max() - after.min() <= 1
+        assert all(counts[sender] > counts[receiver] for sender, receiver, _ in moves)
+
+
+def test_transfers_balanced_counts_move_nothing():
+    assert transfers([4, 4, 4]) == []
+    assert transfers([5, 4, 4]) == []
+
+
+def test_imbalance():
+    assert imbalance([0, 0, 0]) == 0.0
+    assert imbalance([]) == 0.0
+    assert imbalance([5, 5, 5]) == 0.0
+    assert np.isclose(imbalance([6, 3, 3]), 0.5)
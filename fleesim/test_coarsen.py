@@ -0,0 +1,42 @@
+from fleesim.coarsen import coarsen
+
+
+def location(name, kind="town", pop="0"):
+    return [name, "r", "c", "0", "0", kind, "0", pop]
+
+
+def test_chain_collapses_with_summed_distance():
+    locations = [location("A", "conflict_zone"), location("B"), location("C"), location("D", "camp")]
+    routes = [("A", "B", "10"), ("B", "C", "20"), ("C", "D", "30")]
+
+    coarse_locations, coarse_routes, mapping = coarsen(locations, routes, kept={"A", "D"})
+
+    assert [row[0] for row in coarse_locations] == ["A", "D"]
+    assert coarse_routes == [("A", "D", 60.0)]
+    assert mapping["A"] == ("A", 0.0)
+    assert mapping["D"] == ("D", 0.0)
+    assert mapping["B"] == ("A", 10.0)
+    assert mapping["C"] == ("D", 30.0)
+
+
+def test_junctions_are_kept_without_merge():
+    locations = [location("A", "camp"), location("B", "camp"), location("C", "camp"), location("J")]
+    routes = [("A", "J", "1"), ("B", "J", "2"), ("C", "J", "3")]
+
+    coarse_locations, coarse_routes, mapping = coarsen(locations, routes, kept={"A", "B", "C"})
+
+    assert len(coarse_locations) == 4
+    assert sorted(coarse_routes) == [("A", "J", 1.0), ("B", "J", 2.0), ("C", "J", 3.0)]
+    assert mapping["J"] == ("J", 0.0)
+
+
+def test_merge_km_folds_close_locations_and_their_population():
+    locations = [location("A", "camp"), location("B", "camp"), location("C", "camp"), location("J", pop="100"), location("K", pop="50")]
+    routes = [("A", "J", "100"), ("B", "J", "100"), ("C", "K", "100"), ("J", "K", "5")]
+
+    coarse_locations, coarse_routes, mapping = coarsen(locations, routes, kept={"A", "B", "C"}, merge_km=10.0)
+
+    assert [row[0] for row in coarse_locations] == ["A", "B", "C", "K"]
+    assert [row[7] for row in coarse_locations if row[0] == "K"] == ["150"]
+    assert sorted(coarse_routes) == [("A", "K", 105.0), ("B", "K", 105.0), ("C", "K", 100.0)]
+    assert mapping["J"] == ("K", 5.0)
@@ -0,0 +1,12 @@
+import numpy as np
+
+from fleesim.results import abs_errors, rel_errors
+
+
+def test_rel_errors():
+    errors = rel_errors(np.array([3.0, 5.0, 1.0, 0.0]), np.array([2.0, 0.0, 3.0, 1e-6]))
+    assert errors.tolist() == [0.5, 0.0, 0.6667, 0.0]
+
+
+def test_abs_errors():
+    assert abs_errors(np.array([1.0, 2.5]), np.array([1.123456, 4.0])).tolist() == [0.1235, 1.5]
@@ -0,0 +1,16 @@
+import numpy as np
+
+from fleesim.sampling import AliasTable
+
+
+def test_alias_table_draws_follow_the_weights():
+    weights = np.array([1.0, 0.0, 3.0, 6.0])
+    table = AliasTable(weights)
+    np.random.seed(0)
+    frequencies = np.bincount(table.draw_many(200000), minlength=4) / 200000
+    assert np.allclose(frequencies, weights / weights.sum(), atol=0.01)
+    assert frequencies[1] == 0.0
+
+    counts = np.bincount([table.draw() for _ in range(20000)], minlength=4)
+    assert counts[1] == 0
+    assert np.allclose(counts / 20000, weights / weights.sum(), atol=0.02)
@@ -0,0 +1,14 @@
+from fleesim.scaledown import choose_factor, estimate_load
+
+
+def test_choose_factor():
+    assert choose_factor(1000, 10 ** 6) == 1
+    assert choose_factor(1000, 10 ** 6, agent_budget=1000) == 1
+    assert choose_factor(1001, 10 ** 6, agent_budget=1000) == 2
+    assert choose_factor(1000, 10 ** 6, time_budget=1, agent_days_per_second=10 ** 5) == 10
+    assert choose_factor(1000, 10 ** 6, agent_budget=10, time_budget=1, agent_days_per_second=10 ** 5) == 100
+
+
+def test_estimate_load():
+    # 10 agents on day 0, then +5, -3 (ignored) and +2.
+    assert estimate_load([[4, 6]], [0, 5, -3, 2], 4) == (17, 10 + 15 + 15 + 17)
@@ -0,0 +1,67 @@
+import numpy as np
+
+
+class EventTimeline:
+    """
+    Conflicts and border closures compiled into day-sorted event lists, so each
+    simulated day only touches what changes on that day.
+
+    Conflict events are (day, location, on/off), taken from the conflict matrix
+    in InputGeography.conflicts. Closure events are (day, closure, start/end),
+    taken from Ecosystem.closures.
+    """
+
+    def __init__(self, ig, e, num_days):
+        names = list(ig.conflicts.keys())
+        days, locations, on = [], [], []
+        if len(names) > 0:
+            active = np.array([ig.conflicts[name][:num_days] for name in names]).T > 0
+            previous = np.vstack([np.zeros((1, len(names)), dtype=bool), active[:-1]])
+            day, location = np.nonzero(active != previous)
+            days, locations, on = day, location, active[day, location]
+
+        # np.nonzero() returns the events sorted by day.
+        self.conflict_names = names
+        self.conflict_days = np.asarray(days, dtype=np.int32)
+        self.conflict_locations = np.asarray(locations, dtype=np.int32)
+        self.conflict_on = np.asarray(on, dtype=bool)
+
+        closure_events = []
+        for i, c in enumerate(e.closures):
+            for day, start in ((int(c[3]), True), (int(c[4]), False)):
+                if 0 <= day < num_days:
+                    closure_events.append((day, i, start))
+        closure_events.sort()
+        self.closures = list(e.closures)
+        self.closure_days = np.array([day for day, _, _ in closure_events], dtype=np.int32)
+        self.closure_ids = np.array([i for _, i, _ in closure_events], dtype=np.int32)
+        self.closure_start = np.array([start for _, _, start in closure_events], dtype=bool)
+
+    def _day_slice(self, days, t):
+        return slice(np.searchsorted(days, t, side="left"), np.searchsorted(days, t, side="right"))
+
+    def apply_conflicts(self, e, t):
+        """Add and remove the conflict zones that change on day <t>. Returns whether any did."""
+        s = self._day_slice(self.conflict_days, t)
+        for location, on in zip(self.conflict_locations[s], self.conflict_on[s]):
+            if on:
+                e.add_conflict_zone(self.conflict_names[location])
+            else:
+                e.remove_conflict_zone(self.conflict_names[location])
+        return s.stop > s.start
+
+    def apply_closures(self, e, t):
+        """
+        Enact the closures that start or end on day <t>. Ecosystem's own
+        enact_border_closures() is run over just those closures, so closure
+        types are handled exactly as before.
+        """
+        s = self._day_slice(self.closure_days, t)
+        if s.start == s.stop:
+            return
+        all_closures = e.closures
+        e.closures = [self.closures[i] for i in sorted(set(self.closure_ids[s]))]
+        try:
+            e.enact_border_closures(t)
+        finally:
+            e.closures = all_closures
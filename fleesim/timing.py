@@ -0,0 +1,58 @@
+import os
+import time
+
+import numpy as np
+
+
+PHASES = ["conflict_zones", "insertion", "conflict_weights", "border_closures", "evolve", "migration", "reporting"]
+
+
+class StepTimer:
+    """
+    Lap timers for the phases of each simulated day.
+
+    Call start_day() at the top of a day and lap(<phase>) after each phase;
+    the time since the previous call is charged to that phase. When disabled,
+    every call returns immediately. On close() a per-day table with agent
+    counts is written to <directory>/timings.<rank>.csv.
+    """
+
+    def __init__(self, directory, num_days, rank=0, enabled=True):
+        self.directory = directory
+        self.rank = rank
+        self.enabled = enabled
+        self.phase_index = {phase: i for i, phase in enumerate(PHASES)}
+        self.seconds = np.zeros((num_days, len(PHASES)))
+        self.agents = np.zeros((num_days, 2), dtype=np.int64)  # on this rank, in total
+        self.day = 0
+        self.last = 0.0
+
+    def start_day(self, t):
+        if self.enabled:
+            self.day = t
+            self.last = time.perf_counter()
+
+    def lap(self, phase):
+        if self.enabled:
+            now = time.perf_counter()
+            self.seconds[self.day, self.phase_index[phase]] += now - self.last
+            self.last = now
+
+    def end_day(self, e, engine=None):
+        if self.enabled:
+            if engine is None:
+                self.agents[self.day] = (len(e.agents), e.numAgents())
+            else:
+                self.agents[self.day] = (engine.num_local_agents(), engine.num_agents())
+
+    def close(self, stop=None):
+        if not self.enabled:
+            return
+        stop = self.seconds.shape[0] if stop is None else stop
+        os.makedirs(self.directory, exist_ok=True)
+        with open(os.path.join(self.directory, "timings.%d.csv" % self.rank), "w") as f:
+            f.write("Day,agents on rank,total agents,%s,total\n" % ",".join(PHASES))
+            for t in range(stop):
+                f.write("%d,%d,%d," % (t, *self.agents[t]))
+                f.write(",".join("%.6f" % s for s in self.seconds[t]))
+                f.write(",%.6f\n" % self.seconds[t].sum())
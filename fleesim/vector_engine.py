@@ -0,0 +1,191 @@
+import numpy as np
+
+from .engine import Engine
+
+
+class VectorEngine(Engine):
+    """
+    Structure-of-arrays agent engine.
+
+    The agents are not Person objects but rows in NumPy arrays (location
+    index, link index, travelling flag, places travelled), and each day's move
+    decisions, route choices and departures are done with vectorized
+    operations over all idle agents.
+
+    Movement follows the flee rules the driver relies on: an idle agent leaves
+    with its location's move chance and picks an open link with probability
+    proportional to score(endpoint) / (Softening + distance). Agents travel
+    MaxWalkSpeed per day until they first arrive somewhere (with StartOnFoot),
+    MaxMoveSpeed afterwards, and keep moving on the same day while they have
+    distance left and reach a location that is neither a camp nor a conflict
+    zone.
+
+    Once an agent is on a link its speed is fixed, so its arrival day and the
+    distance it has left on that day are known when it sets off. Travelling
+    agents are filed in a calendar queue keyed by arrival day and are not
+    looked at again until then.
+    """
+
+    def __init__(self, e, capacity=1024):
+        self.n = 0
+        self.location = np.zeros(capacity, dtype=np.int32)
+        self.link = np.full(capacity, -1, dtype=np.int32)
+        self.travelling = np.zeros(capacity, dtype=bool)
+        self.places_travelled = np.zeros(capacity, dtype=np.int32)
+        self.arrival_day = np.zeros(capacity, dtype=np.int32)
+        self.arrival_budget = np.zeros(capacity)
+        self.origin = np.zeros(capacity, dtype=np.int32)
+        self.reached_camp = np.zeros(capacity, dtype=bool)
+        self.camp_arrivals = None  # list of (origins, camps) of first camp arrivals, when collected
+        self.day = 0
+        self.arrivals = {}  # arrival day -> list of agent index arrays
+        super().__init__(e)
+
+    def _grow(self, extra):
+        needed = self.n + extra
+        if needed <= len(self.location):
+            return
+        capacity = max(needed, 2 * len(self.location))
+        for name, fill in (("location", 0), ("link", -1), ("travelling", False), ("places_travelled", 0), ("arrival_day", 0), ("arrival_budget", 0.0), ("origin", 0), ("reached_camp", False)):
+            old = getattr(self, name)
+            new = np.full(capacity, fill, dtype=old.dtype)
+            new[:self.n] = old[:self.n]
+            setattr(self, name, new)
+
+    def _append(self, location_index, number):
+        self._grow(number)
+        self.location[self.n:self.n + number] = location_index
+        self.link[self.n:self.n + number] = -1
+        self.travelling[self.n:self.n + number] = False
+        self.places_travelled[self.n:self.n + number] = 0
+        self.origin[self.n:self.n + number] = location_index
+        self.reached_camp[self.n:self.n + number] = self.is_camp[location_index]
+        self.location_counts[location_index] += number
+        self.n += number
+
+    def num_local_agents(self):
+        return self.n
+
+    def _choose_links(self, agents, weights, cumulative, segment_totals):
+        """Pick a weighted open link out of each agent's location; -1 if there is none."""
+        start = self.location[agents]
+        totals = segment_totals[start]
+        base = np.where(self.link_offsets[start] > 0, cumulative[self.link_offsets[start] - 1], 0.0)
+        targets = base + np.random.random(len(agents)) * totals
+        chosen = np.searchsorted(cumulative, targets, side="right")
+        chosen = np.minimum(chosen, self.link_offsets[start + 1] - 1)
+        return np.where(totals > 0, chosen, -1)
+
+    def _depart(self, agents, links, budgets, speeds):
+        """
+        Put <agents> on <links> with <budgets> km left today. Returns the agents
+        that reach the end of their link today and the distance they have left;
+        the others are filed in the calendar under their arrival day.
+        """
+        ok = links >= 0
+        agents, links, budgets = agents[ok], links[ok], budgets[ok]
+        np.subtract.at(self.location_counts, self.location[agents], 1)
+        self.link[agents] = links
+        self.travelling[agents] = True
+
+        remaining = self.link_distance[links] - budgets
+        today = remaining <= 0
+        later = ~today
+        speed = np.where(self.places_travelled[agents[later]] == 0, speeds[0], speeds[1])
+        days = np.maximum(1, np.ceil(remaining[later] / speed - 1e-9)).astype(np.int32)
+        self.arrival_day[agents[later]] = self.day + days
+        self.arrival_budget[agents[later]] = days * speed - remaining[later]
+        for d in np.unique(days):
+            self.arrivals.setdefault(self.day + int(d), []).append(agents[later][days == d])
+
+        return agents[today], -remaining[today]
+
+    def _arrive(self, agents):
+        np.add.at(self.link_traversals, self.link[agents], 1)
+        self.location[agents] = self.link_end[self.link[agents]]
+        self.link[agents] = -1
+        self.travelling[agents] = False
+        self.places_travelled[agents] += 1
+        np.add.at(self.location_counts, self.location[agents], 1)
+
+        if self.camp_arrivals is not None:
+            first = agents[self.is_camp[self.location[agents]] & ~self.reached_camp[agents]]
+            self.camp_arrivals.append((self.origin[first], self.location[first]))
+        self.reached_camp[agents] |= self.is_camp[self.location[agents]]
+
+    def evolve(self):
+        """Move the agents on this rank through one simulated day."""
+        n = self.n
+        speeds = self._speeds()
+        movechance, stops, weights = self._geography()
+        cumulative = np.cumsum(weights)
+        segment_totals = np.add.reduceat(np.append(weights, 0.0), self.link_offsets[:-1]) if len(weights) > 0 else np.zeros(self.num_locations)
+        segment_totals[self.link_offsets[:-1] == self.link_offsets[1:]] = 0.0
+
+        # Agents due today, with the distance they have left on arrival.
+        due = self.arrivals.pop(self.day, [])
+        arriving = np.concatenate(due) if len(due) > 0 else np.zeros(0, dtype=np.int64)
+        budgets = self.arrival_budget[arriving]
+
+        # Idle agents leave with the move chance of their location.
+        idle = np.nonzero(~self.travelling[:n])[0]
+        movers = idle[np.random.random(len(idle)) < movechance[self.location[idle]]]
+        if len(movers) > 0:
+            links = self._choose_links(movers, weights, cumulative, segment_totals)
+            full_budget = np.where(self.places_travelled[movers] == 0, speeds[0], speeds[1])
+            reached, left = self._depart(movers, links, full_budget, speeds)
+            arriving = np.concatenate((arriving, reached))
+            budgets = np.concatenate((budgets, left))
+
+        for _ in range(self.num_locations + 1):
+            if len(arriving) == 0:
+                break
+            self._arrive(arriving)
+
+            # Agents passing through a town keep going while they have distance left.
+            onward = (budgets > 0) & ~stops[self.location[arriving]]
+            if not onward.any():
+                break
+            agents = arriving[onward]
+            arriving, budgets = self._depart(agents, self._choose_links(agents, weights, cumulative, segment_totals), budgets[onward], speeds)
+
+        self.day += 1
+
+    def state_arrays(self):
+        """Agent state for checkpoints."""
+        n = self.n
+        return {
+            "engine_location": self.location[:n],
+            "engine_link": self.link[:n],
+            "engine_travelling": self.travelling[:n],
+            "engine_places_travelled": self.places_travelled[:n],
+            "engine_arrival_day": self.arrival_day[:n],
+            "engine_arrival_budget": self.arrival_budget[:n],
+            "engine_origin": self.origin[:n],
+            "engine_reached_camp": self.reached_camp[:n],
+            "engine_day": np.array(self.day),
+            **self._shared_state_arrays(),
+        }
+
+    def load_state_arrays(self, state):
+        n = len(state["engine_location"])
+        self.n = 0
+        self._grow(n)
+        self.location[:n] = state["engine_location"]
+        self.link[:n] = state["engine_link"]
+        self.travelling[:n] = state["engine_travelling"]
+        self.places_travelled[:n] = state["engine_places_travelled"]
+        self.arrival_day[:n] = state["engine_arrival_day"]
+        self.arrival_budget[:n] = state["engine_arrival_budget"]
+        self.origin[:n] = state["engine_origin"]
+        self.reached_camp[:n] = state["engine_reached_camp"]
+        self.n = n
+        self.day = int(state["engine_day"])
+        self._load_shared_state_arrays(state)
+
+        travelling = np.nonzero(self.travelling[:n])[0]
+        self.arrivals = {}
+        for d in np.unique(self.arrival_day[travelling]):
+            self.arrivals[int(d)] = [travelling[self.arrival_day[travelling] == d]]
+        at_location = ~self.travelling[:n]
+        self.location_counts = np.bincount(self.location[:n][at_location], minlength=self.num_locations).astype(np.int64)
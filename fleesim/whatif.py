@@ -0,0 +1,69 @@
+import hashlib
+import os
+
+import numpy as np
+
+
+INPUTS_FILE = "inputs.npz"
+
+
+def _digest(*parts):
+    h = hashlib.sha1()
+    for part in parts:
+        h.update(repr(part).encode())
+        h.update(b"\0")
+    return h.hexdigest()
+
+
+def input_digests(ig, events, obs, daily_difference, num_days, settings_file=None, engine_name="pflee"):
+    """
+    Fingerprint the inputs of a run: one digest of everything that applies to
+    the whole run (locations, routes, settings file, engine), and one digest
+    per day of that day's conflict and closure events and observations.
+    """
+    settings = b""
+    if settings_file is not None:
+        with open(settings_file, "rb") as f:
+            settings = f.read()
+    static = _digest(ig.locations, ig.links, settings, engine_name)
+
+    daily = []
+    for t in range(num_days):
+        c = events._day_slice(events.conflict_days, t)
+        conflicts = sorted(zip(
+            (events.conflict_names[i] for i in events.conflict_locations[c]), events.conflict_on[c].tolist()
+        ))
+        s = events._day_slice(events.closure_days, t)
+        closures = sorted(
+            (tuple(str(x) for x in events.closures[i][:3]), start) for i, start in zip(events.closure_ids[s], events.closure_start[s].tolist())
+        )
+        daily.append(_digest(conflicts, closures, obs[t].tolist(), int(daily_difference[t])))
+    return static, np.array(daily, dtype=str)
+
+
+def save_inputs(directory, static, daily):
+    """Store the input fingerprint of a baseline run next to its snapshots."""
+    os.makedirs(directory, exist_ok=True)
+    path = os.path.join(directory, INPUTS_FILE)
+    tmp_path = path + ".tmp"
+    with open(tmp_path, "wb") as f:
+        np.savez(f, static=np.array(static, dtype=str), daily=daily)
+    os.replace(tmp_path, path)
+
+
+def divergence_day(directory, static, daily):
+    """
+    The first day whose inputs differ from those of the baseline run whose
+    snapshots are in <directory>: 0 if run-wide inputs differ or there is no
+    fingerprint, and at most the length of the baseline run.
+    """
+    path = os.path.join(directory, INPUTS_FILE)
+    if not os.path.isfile(path):
+        return 0
+    with np.load(path) as f:
+        if str(f["static"]) != static:
+            return 0
+        baseline = f["daily"]
+    n = min(len(baseline), len(daily))
+    differs = np.nonzero(baseline[:n] != daily[:n])[0]
+    return int(differs[0]) if len(differs) > 0 else n
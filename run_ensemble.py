@@ -30,20 +30,41 @@ def main(args):
     if not os.path.isdir(args.media_dir):
         os.mkdir(args.media_dir)
 
-    # Create a list of arguments to pass in to the run_flee.py command, overwriting as needed
-    for i in range(run_count):
+    if args.fork or args.assimilate:
+        # Set the simulation up once and fork every member from that warm state;
+        # member i still writes to <run_dir>/i/output
         run_args = copy.copy(args)
-        del run_args.concurrency
         del run_args.runs
         run_args.cores = 1
-        run_args.run_dir = os.path.join(run_args.run_dir, str(i))
-        run_args.output_dir = os.path.join(run_args.run_dir, "output")
-        run_args.media_dir = os.path.join(run_args.run_dir, "media")
-        arg_set.append(run_args)
-        output_files.append(os.path.join(run_args.output_dir, "camp_data.csv"))
-        media_dirs.append(run_args.media_dir)
-    with multiprocessing.Pool(processes=concurrency) as pool:
-        pool.map(run_flee.main, arg_set)
+        run_args.ensemble_members = run_count
+        run_flee.main(run_args)
+        for i in range(run_count):
+            output_files.append(os.path.join(args.run_dir, str(i), "output", "camp_data.csv"))
+    else:
+        # Create a list of arguments to pass in to the run_flee.py command, overwriting as needed
+        for i in range(run_count):
+            run_args = copy.copy(args)
+            run_args.concurrency = None
+            run_args.ensemble_members = None
+            del run_args.runs
+            run_args.cores = 1
+            run_args.run_dir = os.path.join(run_args.run_dir, str(i))
+            run_args.output_dir = os.path.join(run_args.run_dir, "output")
+            run_args.media_dir = os.path.join(run_args.run_dir, "media")
+            arg_set.append(run_args)
+            output_files.append(os.path.join(run_args.output_dir, "camp_data.csv"))
+            media_dirs.append(run_args.media_dir)
+        with multiprocessing.Pool(processes=concurrency) as pool:
+            pool.map(run_flee.main, arg_set)
+
+        if args.od:
+            # Sum the origin x camp counts of all runs (forked members are summed by run_par.py)
+            od_df = pd.concat(
+                pd.read_csv(os.path.join(run_args.output_dir, "od_data.csv")) for run_args in arg_set
+            )
+            od_df.groupby(["Date", "origin", "camp"], as_index=False)["count"].sum().to_csv(
+                os.path.join(args.output_dir, "od_data.csv"), index=False
+            )
 
     df = pd.concat(pd.read_csv(file_path) for file_path in output_files)
     grouped_df = df.drop(columns=['error']).groupby([
@@ -193,7 +214,87 @@ if __name__ == "__main__":
         action="store_true",
         help="Generate Flee movie",
     )
+    arg_parser.add_argument(
+        "--engine",
+        choices=["pflee", "vector", "cohort", "meanfield"],
+        default="pflee",
+        help="Agent engine for run_par.py: pflee Person objects, the vectorized engine, cohorts of agent counts or deterministic expected values",
+    )
+    arg_parser.add_argument(
+        "--assimilate",
+        action="store_true",
+        help="Fork the runs as a particle filter, resampled by camp error on every observation date (implies --fork)",
+    )
+    arg_parser.add_argument(
+        "--assimilation-sigma",
+        type=float,
+        default=0.1,
+        help="Error scale of the particle filter weights, in units of the total relative error",
+    )
+    arg_parser.add_argument(
+        "--scaledown",
+        type=int,
+        help="PopulationScaledownFactor to use: each agent stands for this many refugees",
+        default=None,
+    )
+    arg_parser.add_argument(
+        "--agent-budget",
+        type=int,
+        help="Pick the smallest scaledown factor that keeps the peak number of agents within this budget",
+        default=None,
+    )
+    arg_parser.add_argument(
+        "--time-budget",
+        type=float,
+        help="Pick the smallest scaledown factor that keeps the estimated run time within this many seconds",
+        default=None,
+    )
+    arg_parser.add_argument(
+        "--agent-days-per-second",
+        type=float,
+        help="Simulation throughput assumed for --time-budget",
+        default=2e5,
+    )
+    arg_parser.add_argument(
+        "--od",
+        action="store_true",
+        help="Also export the summed origin x camp counts of first camp arrivals as od_data.csv",
+    )
+    arg_parser.add_argument(
+        "--od-bucket-days",
+        type=int,
+        default=0,
+        help="Days per time bucket of the origin x camp counts (0: whole run, 7: weekly)",
+    )
+    arg_parser.add_argument(
+        "--coarsen",
+        action="store_true",
+        help="Run on a coarse network: minor towns along routes are collapsed into super-nodes",
+    )
+    arg_parser.add_argument(
+        "--coarsen-merge-km",
+        type=float,
+        default=0.0,
+        help="With --coarsen, also merge minor towns into a neighbour closer than this many km",
+    )
+    arg_parser.add_argument(
+        "--export-csv",
+        action="store_true",
+        help="Also export the raw simulation output of each run as CSV",
+    )
+    arg_parser.add_argument(
+        "--fork",
+        action="store_true",
+        help="Build the simulation once and fork each run from it (single core per run)",
+    )
+
+    # Snapshots and what-if runs are per single run (see run_flee.py)
+    arg_parser.set_defaults(snapshot_dir=None, snapshot_every=10, whatif=None)
 
     args = arg_parser.parse_args()
+    if args.flare and (args.fork or args.assimilate):
+        # Forked members share the conflicts generated once before the fork,
+        # which would remove Flare's variance from the ensemble.
+        arg_parser.error("--flare generates conflicts per run and cannot be combined with --fork or --assimilate")
     main(args)
 
@@ -4,12 +4,14 @@
 import argparse
 import csv
 import math
+import numpy as np
 import os
 import pandas as pd
 import shutil
 import subprocess
 
 from flare.flare import simulate
+from fleesim import bundle, coarsen, observations, od, output, scaledown
 
 
 def update_csv_conf(dict_file_path: str, new_values: dict):
@@ -42,6 +44,90 @@ pd.options.mode.chained_assignment = None
 scenario_dir = os.path.abspath("./scenarios")
 
 
+def copy_atomic(src: str, dst: str):
+    """Copy <src> to <dst> through a temporary file, so concurrent runs never see a partial copy."""
+    tmp = "%s.%d.tmp" % (dst, os.getpid())
+    shutil.copy(src, tmp)
+    os.replace(tmp, dst)
+
+
+def write_camp_and_global_data(results_dir: str, output_dir: str, datelist, scenario_bundle, scaledown_factor=1):
+    # Load the binary results written by run_par.py
+    camp_names, camp_columns, global_columns = output.read_results(results_dir)
+
+    # Each agent of a scaled-down run stands for scaledown_factor refugees; report refugee counts
+    if scaledown_factor > 1:
+        noise = scaledown.sampling_noise(camp_columns["sim"], scaledown_factor)
+        camp_columns["sim"] = camp_columns["sim"] * scaledown_factor
+        camp_columns["data"] = camp_columns["data"] * scaledown_factor
+        for name in global_columns:
+            if name not in ("Day", "Total error"):
+                global_columns[name] = global_columns[name] * scaledown_factor
+
+    combined = pd.DataFrame(
+        {
+            "Date": datelist[camp_columns["day"]],
+            "sim": camp_columns["sim"],
+            "data": camp_columns["data"],
+            "error": camp_columns["error"],
+            "camp": np.array(camp_names)[camp_columns["camp"]],
+        }
+    )
+    combined = combined.sort_values(by="Date", ascending=True, kind="mergesort")
+
+    global_df = pd.DataFrame(global_columns)
+    global_df.insert(1, "Date", datelist[global_columns["Day"]], True)
+    print(global_df)
+
+    # Add latitude and longitude of camps to output data, taken from the
+    # bundled location table (name, pop, latitude, longitude, ...)
+    locations = scenario_bundle["locations"]
+    latitude = dict(zip(locations[:, 0], locations[:, 2].astype(float)))
+    longitude = dict(zip(locations[:, 0], locations[:, 3].astype(float)))
+
+    combined["Longitude"] = combined["camp"].map(longitude)
+    combined["Latitude"] = combined["camp"].map(latitude)
+
+    # Save output to files: one for camp values, one for totals (i.e. global)
+    combined.to_csv(os.path.join(output_dir, "camp_data.csv"), index=False)
+
+    if scaledown_factor > 1:
+        # Sampling noise (standard deviation) of the rescaled camp counts
+        noise_df = pd.DataFrame(
+            {
+                "Date": datelist[camp_columns["day"]],
+                "camp": np.array(camp_names)[camp_columns["camp"]],
+                "sim": camp_columns["sim"],
+                "sim_noise": np.round(noise, 2),
+                "scaledown_factor": scaledown_factor,
+            }
+        )
+        noise_df.sort_values(by="Date", ascending=True, kind="mergesort").to_csv(
+            os.path.join(output_dir, "sampling_noise.csv"), index=False
+        )
+        final_day = camp_columns["day"] == camp_columns["day"].max()
+        relative = noise[final_day].sum() / max(camp_columns["sim"][final_day].sum(), 1)
+        print(f"Scaledown factor {scaledown_factor}: relative sampling noise of final camp totals ~{relative:.2%}")
+
+    global_df.to_csv(os.path.join(output_dir, "global_data.csv"), index=False)
+
+
+def write_od_data(od_path: str, output_dir: str, datelist, scaledown_factor=1):
+    # Origin x camp counts of first camp arrivals, one row per time bucket
+    location_names, bucket_days, bucket, origin, destination, count = od.read_od(od_path)
+    count = count * scaledown_factor
+    od_df = pd.DataFrame(
+        {
+            "Date": datelist[bucket * bucket_days],
+            "origin": np.array(location_names)[origin],
+            "camp": np.array(location_names)[destination],
+            "count": count,
+        }
+    )
+    od_df = od_df.sort_values(by=["Date", "origin", "camp"], kind="mergesort")
+    od_df.to_csv(os.path.join(output_dir, "od_data.csv"), index=False)
+
+
 def main(args):
     rundir = os.path.abspath(args.run_dir)
     if not os.path.exists(rundir):
@@ -56,6 +142,11 @@ def main(args):
     if os.path.exists(run_dir_data_path):
         shutil.rmtree(run_dir_data_path)
     shutil.copytree(base_dir_data_path, run_dir_data_path)
+    if args.coarsen:
+        # Approximate run on super-nodes; camps keep their names, so outputs
+        # are still reported against the original camps.
+        before, after = coarsen.coarsen_scenario(run_dir_data_path, merge_km=args.coarsen_merge_km)
+        print(f"Coarsened the network from {before} to {after} locations")
     conflict_period_file = os.path.join(
         run_dir_data_path, "input_csv", "conflict_period.csv"
     )
@@ -92,6 +183,23 @@ def main(args):
     )
     simsetting = csv_config_to_dict(simsetting_file)
 
+    # Pick the PopulationScaledownFactor: given, or the smallest that fits the
+    # agent/time budget, or the scenario's own. Outputs are rescaled by it.
+    scenario_factor = int(float(simsetting.get("PopulationScaledownFactor", 1)))
+    scaledown_factor = scenario_factor
+    if args.scaledown is not None:
+        scaledown_factor = args.scaledown
+    elif args.agent_budget or args.time_budget:
+        # Compiled in memory only: the bundle keeps the observations at the run's factor.
+        unscaled = bundle.load_bundle(run_dir_data_path, sections=("observations",), num_days=ndays, scaledown_factor=1, save=False)
+        peak_agents, agent_days = scaledown.estimate_load(unscaled["observations"], unscaled["daily_difference"], ndays)
+        scaledown_factor = scaledown.choose_factor(
+            peak_agents, agent_days, args.agent_budget, args.time_budget, args.agent_days_per_second
+        )
+        print(f"Estimated {peak_agents} agents at peak and {agent_days} agent-days: scaledown factor {scaledown_factor}")
+    if scaledown_factor != scenario_factor:
+        update_csv_conf(simsetting_file, {"PopulationScaledownFactor": scaledown_factor})
+
     if args.flare:
         window_size = math.gcd(ndays, ndays // 20)
         simulate(
@@ -106,6 +214,7 @@ def main(args):
     print(f"Running P-FLEE with cores = {cores}")
 
     # Run the Flee ABM
+    results_dir = os.path.join(rundir, "results")
     if int(cores) <= 1:
         amb_cmd = (
             f"python3 {os.path.join(curr_dir_path, 'run_par.py')} {os.path.join(run_dir_data_path, 'input_csv')} "
@@ -116,11 +225,45 @@ def main(args):
             f"mpirun -np {cores} python3 {os.path.join(curr_dir_path, 'run_par.py')} {os.path.join(run_dir_data_path, 'input_csv')} "
             f"{os.path.join(run_dir_data_path, 'source_data')} {ndays} {os.path.join(run_dir_data_path, 'simsetting.csv')}"
         )
+    amb_cmd += f" --output-dir {results_dir}"
+    amb_cmd += f" --engine {args.engine}"
+    if args.od:
+        amb_cmd += f" --od --od-bucket-days {args.od_bucket_days}"
+    if args.snapshot_dir:
+        # Keep every snapshot, so later what-if runs can start close to their first change
+        amb_cmd += f" --checkpoint-every {args.snapshot_every} --checkpoint-dir {os.path.abspath(args.snapshot_dir)} --keep-checkpoints 0"
+    if args.whatif:
+        amb_cmd += f" --whatif {os.path.abspath(args.whatif)}"
+    if args.ensemble_members:
+        amb_cmd += f" --ensemble-members {args.ensemble_members}"
+        if args.concurrency:
+            amb_cmd += f" --ensemble-concurrency {args.concurrency}"
+        if args.assimilate:
+            amb_cmd += f" --assimilate --assimilation-sigma {args.assimilation_sigma}"
 
 
     print(amb_cmd)
-    with open(os.path.join(rundir, "out.csv"), "wb") as outfile:
-        subprocess.run(amb_cmd, cwd=rundir, stdout=outfile, shell=True)
+    if args.export_csv and not args.ensemble_members:
+        with open(os.path.join(rundir, "out.csv"), "wb") as outfile:
+            subprocess.run(amb_cmd + " --csv", cwd=rundir, stdout=outfile, shell=True)
+    else:
+        subprocess.run(amb_cmd, cwd=rundir, shell=True)
+
+    # Keep the interpolated observation cache and compiled bundle with the
+    # scenario so later runs reuse them; stale bundle sections are recompiled.
+    run_obs_cache = os.path.join(run_dir_data_path, observations.CACHE_DIR_NAME)
+    # Ensemble members running in parallel copy back to the same place, so
+    # each file is replaced atomically.
+    if os.path.isdir(run_obs_cache):
+        base_obs_cache = os.path.join(base_dir_data_path, observations.CACHE_DIR_NAME)
+        os.makedirs(base_obs_cache, exist_ok=True)
+        for name in os.listdir(run_obs_cache):
+            if name.endswith(".tmp"):
+                continue
+            copy_atomic(os.path.join(run_obs_cache, name), os.path.join(base_obs_cache, name))
+    run_bundle = os.path.join(run_dir_data_path, bundle.BUNDLE_FILE)
+    if os.path.isfile(run_bundle) and not args.coarsen:
+        copy_atomic(run_bundle, os.path.join(base_dir_data_path, bundle.BUNDLE_FILE))
 
     # specify directories
     if not os.path.isdir(args.output_dir):
@@ -128,72 +271,31 @@ def main(args):
     if not os.path.isdir(args.media_dir):
         os.mkdir(args.media_dir)
 
-    csv_file = os.path.join(rundir, "out.csv")
-
     datelist = pd.date_range(
         start=conflict_period.get("StartDate"), periods=ndays, freq="D"
     )
 
-    with open(csv_file, "r") as my_input_file:
-        out_df = pd.read_csv(my_input_file)
-        print(out_df)
-        out_df.insert(1, "Date", datelist, True)
-
-    out_df.to_csv(os.path.join(rundir, "outdate.csv"), index=False)
-
-    # Restructure output data
-    features = [
-        i
-        for i in out_df.columns
-        if ("sim" in i or "error" in i or "data" in i)
-        and ("total" not in i.lower() and "refugees" not in i)
-    ]
-
-    camps = set([i.split(" ")[0] for i in features])
-
-    count = 0
-    for camp in camps:
-        cols = ["Date"]
-        camp_feats = [i for i in features if camp in i]
-        # camp_feats = [i for i in features if camp == i.split('_')[0]]
-        cols.extend(camp_feats)
-        df_ = out_df[cols]
-        df_["camp"] = camp
-        for cf in camp_feats:
-            df_.rename(columns={cf: cf.split(" ")[1]}, inplace=True)
-        df_["camp"] = camp
-        if count == 0:
-            combined = df_
-        else:
-            combined = combined.append(df_)
-        count += 1
-
-    combined = combined.sort_values(by="Date", ascending=True)
-
-    # Add latitude and longitude of camps to output data
-    locations_file = os.path.join(run_dir_data_path, "input_csv/locations.csv")
-    locations_df = pd.read_csv(locations_file, index_col=0)
-
-    # declare an empty list to store
-    # latitude and longitude of values
-    longitude = []
-    latitude = []
-
-    print(locations_df)
-    for i in combined["camp"]:
-        latitude.append(locations_df.loc[i, "latitude"])
-        longitude.append(locations_df.loc[i, "longitude"])
-
-    # now add this column to dataframe
-    combined["Longitude"] = longitude
-    combined["Latitude"] = latitude
-
-    # Save output to files: one for camp values, one for totals (i.e. global)
-    combined.to_csv(os.path.join(args.output_dir, "camp_data.csv"), index=False)
+    scenario_bundle = bundle.load_bundle(run_dir_data_path, sections=("geography",))
+    if args.ensemble_members:
+        # Each forked member wrote its results to results/<i>
+        for i in range(args.ensemble_members):
+            member_output_dir = os.path.join(rundir, str(i), "output")
+            os.makedirs(member_output_dir, exist_ok=True)
+            write_camp_and_global_data(
+                os.path.join(results_dir, str(i)), member_output_dir, datelist, scenario_bundle, scaledown_factor
+            )
+    else:
+        write_camp_and_global_data(results_dir, args.output_dir, datelist, scenario_bundle, scaledown_factor)
 
-    other_cols = set(out_df.columns) - set(features)
+    if args.od:
+        # In ensemble mode run_par.py has already summed the members' counts
+        write_od_data(os.path.join(results_dir, od.OD_FILE), args.output_dir, datelist, scaledown_factor)
 
-    out_df[other_cols].to_csv(os.path.join(args.output_dir, "global_data.csv"), index=False)
+    if args.export_csv and not args.ensemble_members:
+        with open(os.path.join(rundir, "out.csv"), "r") as my_input_file:
+            out_df = pd.read_csv(my_input_file)
+        out_df.insert(1, "Date", datelist, True)
+        out_df.to_csv(os.path.join(rundir, "outdate.csv"), index=False)
 
     for filename in os.listdir("."):
         if "agents.out" in filename:
@@ -300,6 +402,82 @@ if __name__ == "__main__":
         action="store_true",
         help="Use conflict generated by Flare",
     )
+    arg_parser.add_argument(
+        "--engine",
+        choices=["pflee", "vector", "cohort", "meanfield"],
+        default="pflee",
+        help="Agent engine for run_par.py: pflee Person objects, the vectorized engine, cohorts of agent counts or deterministic expected values",
+    )
+    arg_parser.add_argument(
+        "--scaledown",
+        type=int,
+        help="PopulationScaledownFactor to use: each agent stands for this many refugees",
+        default=None,
+    )
+    arg_parser.add_argument(
+        "--agent-budget",
+        type=int,
+        help="Pick the smallest scaledown factor that keeps the peak number of agents within this budget",
+        default=None,
+    )
+    arg_parser.add_argument(
+        "--time-budget",
+        type=float,
+        help="Pick the smallest scaledown factor that keeps the estimated run time within this many seconds",
+        default=None,
+    )
+    arg_parser.add_argument(
+        "--agent-days-per-second",
+        type=float,
+        help="Simulation throughput assumed for --time-budget",
+        default=2e5,
+    )
+    arg_parser.add_argument(
+        "--od",
+        action="store_true",
+        help="Also export origin x camp counts of first camp arrivals as od_data.csv",
+    )
+    arg_parser.add_argument(
+        "--od-bucket-days",
+        type=int,
+        default=0,
+        help="Days per time bucket of the origin x camp counts (0: whole run, 7: weekly)",
+    )
+    arg_parser.add_argument(
+        "--snapshot-dir",
+        action="store",
+        help="Keep snapshots of this run in this directory, as a baseline for --whatif runs",
+        default=None,
+    )
+    arg_parser.add_argument(
+        "--snapshot-every",
+        type=int,
+        help="Days between snapshots kept in --snapshot-dir",
+        default=10,
+    )
+    arg_parser.add_argument(
+        "--whatif",
+        action="store",
+        help="Snapshot directory of a baseline run: only re-simulate from the first day whose inputs differ",
+        default=None,
+    )
+    arg_parser.add_argument(
+        "--coarsen",
+        action="store_true",
+        help="Run on a coarse network: minor towns along routes are collapsed into super-nodes",
+    )
+    arg_parser.add_argument(
+        "--coarsen-merge-km",
+        type=float,
+        default=0.0,
+        help="With --coarsen, also merge minor towns into a neighbour closer than this many km",
+    )
+    arg_parser.add_argument(
+        "--export-csv",
+        action="store_true",
+        help="Also export the raw simulation output as out.csv and outdate.csv",
+    )
+    arg_parser.set_defaults(ensemble_members=None, concurrency=None, assimilate=False, assimilation_sigma=0.1)
     args = arg_parser.parse_args()
     main(args)
 
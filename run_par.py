@@ -1,79 +1,334 @@
+import argparse
+import sys
+
+import mpi4py
+
+# Ensemble members are forked from this process, which must therefore never
+# initialise MPI (forking after MPI_Init is undefined behaviour): such runs
+# are serial, with fleesim.serial standing in for the communicator.
+ensemble_parser = argparse.ArgumentParser(add_help=False)
+ensemble_parser.add_argument("--ensemble-members", type=int, default=0)
+serial_run = __name__ == "__main__" and ensemble_parser.parse_known_args()[0].ensemble_members > 0
+if serial_run:
+  mpi4py.rc.initialize = False
+  mpi4py.rc.finalize = False
+
 from flee import pflee as flee
 from flee.datamanager import handle_refugee_data,read_period
-from flee.datamanager import DataTable #DataTable.subtract_dates()
 from flee import InputGeography
-import numpy as np
-import flee.postprocessing.analysis as a
-import sys
+from fleesim import assimilation, balance, bundle, checkpoint, dormant, ensemble, flows, insertion, od, observations, output, probes, reporting, results, sampling, serial, timeline, timing, whatif
+from fleesim.cohort_engine import CohortEngine
+from fleesim.meanfield_engine import MeanFieldEngine
+from fleesim.vector_engine import VectorEngine
+import os
+
+def AddInitialRefugees(e, loc, num_refugees, engine=None, day0_camps=None):
+  """ Add the initial refugees to a location, using the day 0 observation"""
+  num_refugees = int(num_refugees)
+  if engine is not None:
+    engine.add_agents(loc, num_refugees)
+  elif day0_camps is not None:
+    day0_camps.add(loc, num_refugees)
+  elif bulk_insertion:
+    insertion.add_agents(e, loc, num_refugees)
+  else:
+    for i in range(0, num_refugees):
+      e.addAgent(location=loc)
+
+def ReadRefugeeTable(input_csv_directory, validation_data_directory, start_date):
+  """ Load the UNHCR validation data, with registration corrections applied"""
+  d = handle_refugee_data.RefugeeTable(csvformat="generic", data_directory=validation_data_directory, start_date=start_date, data_layout="data_layout.csv", population_scaledown_factor=flee.SimulationSettings.PopulationScaledownFactor)
 
-def AddInitialRefugees(e, d, loc):
-  """ Add the initial refugees to a location, using the location name"""
-  num_refugees = int(d.get_field(loc.name, 0, FullInterpolation=True))
-  for i in range(0, num_refugees):
-    e.addAgent(location=loc)
+  d.ReadL1Corrections("%s/registration_corrections.csv" % input_csv_directory)
+  return d
 
 insert_day0_refugees_in_camps = True
 
-if __name__ == "__main__":
+# Hold the day 0 camp populations as counters, and only create agents for
+# those that leave (pflee engine only).
+lazy_day0_camps = True
 
-  start_date,end_time = read_period.read_conflict_period("{}/conflict_period.csv".format(sys.argv[1]))
+# Insert agents per location in bulk, with daily arrivals spread over the
+# conflict zones by one multinomial draw instead of one weighted pick each.
+bulk_insertion = True
 
-  if len(sys.argv)<4:
-    print("Please run using: python3 run.py <your_csv_directory> <your_refugee_data_directory> <duration in days> <optional: simulation_settings.csv> > <output_directory>/<output_csv_filename>")
-
-  input_csv_directory = sys.argv[1]
-  validation_data_directory = sys.argv[2]
-  if int(sys.argv[3]) > 0:
-    end_time = int(sys.argv[3])
+if __name__ == "__main__":
 
-  if len(sys.argv)==5:
-    flee.SimulationSettings.ReadFromCSV(sys.argv[4])
+  arg_parser = argparse.ArgumentParser(usage="python3 run_par.py <your_csv_directory> <your_refugee_data_directory> <duration in days> <optional: simulation_settings.csv> [options] > <output_directory>/<output_csv_filename>")
+  arg_parser.add_argument("input_csv_directory")
+  arg_parser.add_argument("validation_data_directory")
+  arg_parser.add_argument("duration", type=int, help="Number of days to simulate (0 or less: use conflict_period.csv).")
+  arg_parser.add_argument("simulation_settings", nargs="?", default=None)
+  arg_parser.add_argument("--output-dir", default=None, help="Write results as compressed .npz chunks to this directory instead of printing CSV.")
+  arg_parser.add_argument("--output-chunk-days", type=int, default=100, help="Number of days per .npz chunk.")
+  arg_parser.add_argument("--csv", action="store_true", help="Also print CSV rows to stdout when --output-dir is set.")
+  arg_parser.add_argument("--report-interval", type=int, default=1, help="Days between collective gathers of camp counts onto rank 0.")
+  arg_parser.add_argument("--timings-dir", default=None, help="Write per-day phase timings for each rank to this directory.")
+  arg_parser.add_argument("--checkpoint-every", type=int, default=0, help="Snapshot the simulation state every N days (0: never).")
+  arg_parser.add_argument("--checkpoint-dir", default="checkpoints", help="Directory for per-rank checkpoint files.")
+  arg_parser.add_argument("--keep-checkpoints", type=int, default=2, help="Number of most recent checkpoints to keep (0: all, e.g. as what-if snapshots).")
+  arg_parser.add_argument("--resume", action="store_true", help="Continue from the latest checkpoint in --checkpoint-dir, if any.")
+  arg_parser.add_argument("--whatif", default=None, help="Checkpoint directory of a baseline run: start from its latest snapshot before the first day whose inputs differ.")
+  arg_parser.add_argument("--ensemble-members", type=int, default=0, help="Fork this many ensemble members from the initialised simulation; member i writes to <output-dir>/i.")
+  arg_parser.add_argument("--ensemble-concurrency", type=int, default=None, help="Maximum number of forked members running at once (default: number of CPUs).")
+  arg_parser.add_argument("--assimilate", action="store_true", help="Run the ensemble members as a particle filter: resample them by their camp error on every observation date in the validation data.")
+  arg_parser.add_argument("--assimilation-dir", default="assimilation", help="Directory for the per-segment member snapshots and the resampling log.")
+  arg_parser.add_argument("--assimilation-sigma", type=float, default=0.1, help="Error scale of the member weights exp(-error^2 / 2 sigma^2), in units of the total relative error.")
+  arg_parser.add_argument("--engine", choices=["pflee", "vector", "cohort", "meanfield"], default="pflee", help="Agent engine: pflee Person objects, the vectorized structure-of-arrays engine, agent counts moved as cohorts, or deterministic expected values.")
+  arg_parser.add_argument("--flows", action="store_true", help="Also write daily location occupancy and link traversal counts to <output-dir>/flows.npz.")
+  arg_parser.add_argument("--od", action="store_true", help="Also write origin x camp counts of first camp arrivals to <output-dir>/od.npz (pflee and vector engines).")
+  arg_parser.add_argument("--od-bucket-days", type=int, default=0, help="Days per time bucket of the origin-destination counts (0: whole run, 7: weekly).")
+  arg_parser.add_argument("--probe", action="append", default=[], help="Sample a registered probe into <output-dir>/probes.npz, as <name> or <name>:<every N days>; may be repeated.")
+  arg_parser.add_argument("--probe-module", action="append", default=[], help="Import a Python module that registers its own probes; may be repeated.")
+  arg_parser.add_argument("--rebalance-threshold", type=float, default=0.0, help="Move agents between MPI ranks in bulk when the agent imbalance (max/mean - 1) exceeds this (0: never, pflee engine).")
+  arg_parser.add_argument("--balance-report", default=None, help="Write per-rank agent counts and evolve times per day to this CSV (default with --rebalance-threshold: <output-dir>/load_balance.csv).")
+  arg_parser.add_argument("--no-bundle", action="store_true", help="Parse the scenario CSVs directly instead of loading the compiled scenario_bundle.npz.")
+  args = arg_parser.parse_args()
+
+  if args.ensemble_members > 0 and (args.output_dir is None or args.resume or args.whatif):
+    arg_parser.error("--ensemble-members requires --output-dir and cannot be combined with --resume or --whatif")
+  if args.assimilate and (args.ensemble_members == 0 or args.flows or args.od or len(args.probe) > 0):
+    arg_parser.error("--assimilate requires --ensemble-members and cannot be combined with --flows, --od or --probe")
+  if serial_run and serial.launched_ranks() > 1:
+    arg_parser.error("--ensemble-members forks single-process members; start it without mpirun -np N")
+  if args.resume and args.whatif:
+    arg_parser.error("--resume and --whatif cannot be combined")
+  if args.whatif and args.checkpoint_every > 0 and os.path.abspath(args.whatif) == os.path.abspath(args.checkpoint_dir):
+    arg_parser.error("--whatif needs a --checkpoint-dir other than the baseline snapshots")
+  if args.flows and args.output_dir is None:
+    arg_parser.error("--flows requires --output-dir")
+  if len(args.probe) > 0 and args.output_dir is None:
+    arg_parser.error("--probe requires --output-dir")
+  probes.import_probe_modules(args.probe_module)
+  try:
+    probe_list = [probes.parse_probe(spec) for spec in args.probe]
+  except ValueError as err:
+    arg_parser.error(str(err))
+  if args.od and (args.output_dir is None or args.engine not in ("pflee", "vector")):
+    arg_parser.error("--od requires --output-dir and the pflee or vector engine")
+  if args.flows or args.od:
+    # Agents have to come from fleesim.insertion, as Persons that report the
+    # links they complete and the first camp they reach.
+    bulk_insertion = True
+  if (args.rebalance_threshold > 0 or args.balance_report is not None) and args.engine != "pflee":
+    arg_parser.error("--rebalance-threshold and --balance-report require the pflee engine")
+
+  input_csv_directory = args.input_csv_directory
+  validation_data_directory = args.validation_data_directory
+
+  start_date,end_time = read_period.read_conflict_period("{}/conflict_period.csv".format(input_csv_directory))
+
+  if args.duration > 0:
+    end_time = args.duration
+
+  if args.simulation_settings is not None:
+    flee.SimulationSettings.ReadFromCSV(args.simulation_settings)
   flee.SimulationSettings.FlareConflictInputFile = "%s/conflicts.csv" % input_csv_directory
 
+  if serial_run:
+    flee.MPIManager = serial.SerialMPIManager
   e = flee.Ecosystem()
 
-  ig = InputGeography.InputGeography()
+  # The compiled bundle lives in the scenario directory, so it is only used for
+  # the usual <scenario>/input_csv + <scenario>/source_data layout.
+  scenario_path = os.path.dirname(os.path.abspath(input_csv_directory))
+  use_bundle = not args.no_bundle and os.path.abspath(validation_data_directory) == os.path.join(scenario_path, "source_data")
 
-  ig.ReadFlareConflictInputCSV(flee.SimulationSettings.FlareConflictInputFile)
+  if use_bundle:
+    # Rank 0 recompiles any stale part of the bundle before the others load it.
+    if e.mpi.rank == 0:
+      bundle.load_bundle(scenario_path, num_days=end_time, scaledown_factor=flee.SimulationSettings.PopulationScaledownFactor)
+    e.mpi.comm.Barrier()
+    b = bundle.load_bundle(scenario_path, num_days=end_time, scaledown_factor=flee.SimulationSettings.PopulationScaledownFactor)
+    ig = b.input_geography()
+  else:
+    ig = InputGeography.InputGeography()
 
-  ig.ReadLocationsFromCSV("%s/locations.csv" % input_csv_directory)
+    ig.ReadFlareConflictInputCSV(flee.SimulationSettings.FlareConflictInputFile)
 
-  ig.ReadLinksFromCSV("%s/routes.csv" % input_csv_directory)
+    ig.ReadLocationsFromCSV("%s/locations.csv" % input_csv_directory)
 
-  ig.ReadClosuresFromCSV("%s/closures.csv" % input_csv_directory)
+    ig.ReadLinksFromCSV("%s/routes.csv" % input_csv_directory)
 
-  e,lm = ig.StoreInputGeographyInEcosystem(e)
+    ig.ReadClosuresFromCSV("%s/closures.csv" % input_csv_directory)
 
-  d = handle_refugee_data.RefugeeTable(csvformat="generic", data_directory=validation_data_directory, start_date=start_date, data_layout="data_layout.csv", population_scaledown_factor=flee.SimulationSettings.PopulationScaledownFactor)
-
-  d.ReadL1Corrections("%s/registration_corrections.csv" % input_csv_directory)
+  e,lm = ig.StoreInputGeographyInEcosystem(e)
 
-  output_header_string = "Day,"
+  # With the vector, cohort or mean-field engine, agents are rows in NumPy
+  # arrays, counts or expected numbers rather than Person objects; the
+  # Ecosystem keeps the geography, conflicts and scores.
+  engine = None
+  try:
+    if args.engine == "vector":
+      engine = VectorEngine(e)
+    elif args.engine == "cohort":
+      engine = CohortEngine(e)
+    elif args.engine == "meanfield":
+      engine = MeanFieldEngine(e)
+  except ValueError as err:
+    arg_parser.error(str(err))
+
+  # Conflict and closure changes as day-sorted events, applied only on their day.
+  events = timeline.EventTimeline(ig, e, end_time)
+
+  # Conflict weights are only refreshed when they change; single conflict
+  # locations are drawn from an alias table.
+  sampler = sampling.ConflictSampler(e)
 
   camp_locations      = e.get_camp_names()
+  camps               = [lm[l] for l in camp_locations]
 
-  for l in camp_locations:
-      if insert_day0_refugees_in_camps:  
-          AddInitialRefugees(e,d,lm[l])
-      output_header_string += "%s sim,%s data,%s error," % (lm[l].name, lm[l].name, lm[l].name)
+  # Interpolated observations (days x camps) and daily total differences,
+  # from the bundle or cached next to the validation data.
+  if use_bundle:
+    obs, daily_difference = b.observations(camp_locations, end_time)
+  else:
+    obs, daily_difference = observations.load_observations(validation_data_directory, "%s/registration_corrections.csv" % input_csv_directory, camp_locations, end_time, start_date, flee.SimulationSettings.PopulationScaledownFactor, lambda: ReadRefugeeTable(input_csv_directory, validation_data_directory, start_date))
 
-  output_header_string += "Total error,refugees in camps (UNHCR),total refugees (simulation),raw UNHCR refugee count,refugees in camps (simulation),refugee_debt"
-
-  if e.getRankN(0):
-      print(output_header_string)
+  # Preallocated (days, camps, sim/data/error) results plus global totals.
+  res = results.ResultBuffer(end_time, camp_locations)
 
   # Set up a mechanism to incorporate temporary decreases in refugees
   refugee_debt = 0
   refugees_raw = 0 #raw (interpolated) data from TOTAL UNHCR refugee count only.
 
-  for t in range(0,end_time):
+  day0_camps = None
+  if engine is None and lazy_day0_camps:
+    day0_camps = dormant.DormantPopulation(e)
+
+  # Fingerprint the inputs per day, so a what-if run can find where it departs
+  # from its baseline; checkpointed runs store it with their snapshots.
+  static_inputs, daily_inputs = whatif.input_digests(ig, events, obs, daily_difference, end_time, args.simulation_settings, args.engine)
+
+  # Days x locations occupancy and days x links traversal counts.
+  flow_recorder = None
+  if args.flows:
+    flow_recorder = flows.FlowRecorder(e, end_time, engine)
+
+  # Origin x camp counts of first camp arrivals.
+  od_recorder = None
+  if args.od:
+    od_recorder = od.ODRecorder(e, end_time, args.od_bucket_days, engine)
+
+  # Registered per-day metrics, sampled on their own cadence.
+  probe_set = None
+  if len(probe_list) > 0:
+    probe_set = probes.ProbeSet(e, camps, end_time, probe_list, engine)
+
+  # Their days so far are checkpointed and restored with the simulation.
+  recorders = [r for r in (flow_recorder, od_recorder, probe_set) if r is not None]
+
+  start_day = None
+  stop_day = end_time
+  restore_dir = args.checkpoint_dir
+  if args.resume:
+    start_day = checkpoint.latest_day(args.checkpoint_dir, e.mpi)
+  elif args.whatif is not None:
+    divergence = whatif.divergence_day(args.whatif, static_inputs, daily_inputs)
+    start_day = checkpoint.latest_day(args.whatif, e.mpi, until=divergence)
+    restore_dir = args.whatif
+    if e.getRankN(0):
+      print("Inputs differ from the baseline from day %d on." % divergence, file=sys.stderr)
+
+  if args.assimilate:
+    # Each particle filter member inserts the day 0 agents or restores its
+    # snapshot itself, after being forked below.
+    start_day = 0
+  elif start_day is None:
+    start_day = 0
+    for j,l in enumerate(camp_locations):
+        if insert_day0_refugees_in_camps:  
+            AddInitialRefugees(e,lm[l],obs[0,j],engine,day0_camps)
+  else:
+    refugees_raw, refugee_debt = checkpoint.restore(restore_dir, start_day, e, events, res, engine, day0_camps, recorders)
+    if e.getRankN(0):
+      print("Resuming from the checkpoint of day %d." % start_day, file=sys.stderr)
+
+  # Particle filter: members run from one observation date to the next, and
+  # the best of them are resampled and forked again for the next segment.
+  member = None
+  if args.assimilate:
+    d = ReadRefugeeTable(input_csv_directory, validation_data_directory, start_date)
+    stops = assimilation.segment_ends(assimilation.observed_days(d, camp_locations, end_time), end_time)
+    member, segment, start_day, stop_day, source = assimilation.run_filter(args.assimilation_dir, args.ensemble_members, stops, args.assimilation_sigma, args.ensemble_concurrency)
+    if member is None:
+      if len(source) > 0:
+        sys.exit("Ensemble members failed in segment %d: %s" % (segment, source))
+      sys.exit(0)
+    if source is None:
+      for j,l in enumerate(camp_locations):
+        if insert_day0_refugees_in_camps:
+          AddInitialRefugees(e,lm[l],obs[0,j],engine,day0_camps)
+    else:
+      refugees_raw, refugee_debt = checkpoint.restore(source, start_day, e, events, res, engine, day0_camps)
+      # Continue from the chosen state with fresh randomness.
+      ensemble.reseed()
+    if engine is not None:
+      engine.reseed()
+    args.output_dir = os.path.join(args.output_dir, str(member))
+    args.checkpoint_dir = os.path.join(args.checkpoint_dir, str(member))
+    args.csv = False
+    if args.timings_dir is not None:
+      args.timings_dir = os.path.join(args.timings_dir, str(member))
+    if stop_day < end_time:
+      # Only the members of the last segment write output.
+      args.output_dir = None
+
+  # Fork ensemble members from this warm state: geography, Ecosystem, cached
+  # observations and day 0 agents are built once for all of them.
+  elif args.ensemble_members > 0:
+    member, failed = ensemble.fork_members(args.ensemble_members, args.ensemble_concurrency)
+    if member is None:
+      if len(failed) > 0:
+        sys.exit("Ensemble members failed: %s" % failed)
+      if args.od:
+        # Sum the origin-destination counts of all members.
+        od.merge_od([os.path.join(args.output_dir, str(i), od.OD_FILE) for i in range(args.ensemble_members)], os.path.join(args.output_dir, od.OD_FILE))
+      sys.exit(0)
+    if engine is not None:
+      engine.reseed()
+    args.output_dir = os.path.join(args.output_dir, str(member))
+    args.checkpoint_dir = os.path.join(args.checkpoint_dir, str(member))
+    args.csv = False
+    if args.timings_dir is not None:
+      args.timings_dir = os.path.join(args.timings_dir, str(member))
+
+  # Saved once the checkpoint directory is final: ensemble members each
+  # checkpoint into their own.
+  if args.checkpoint_every > 0 and e.getRankN(0):
+    whatif.save_inputs(args.checkpoint_dir, static_inputs, daily_inputs)
+
+  writer = None
+  if args.output_dir is not None and e.getRankN(0):
+    writer = output.ResultWriter(args.output_dir, res, chunk_days=args.output_chunk_days)
+
+  # Camp counts are summed onto rank 0, which alone owns the output.
+  reporter = reporting.Reporter(e, camps, res, obs, interval=args.report_interval, writer=writer, print_csv=(args.output_dir is None and stop_day == end_time) or args.csv, engine=engine)
+  reporter.start()
+  reporter.emit_restored(start_day)
+
+  # Per-rank agent and evolve time telemetry, rebalancing when they drift apart.
+  balancer = None
+  if args.rebalance_threshold > 0 or args.balance_report is not None:
+    balance_report = args.balance_report
+    if balance_report is None:
+      balance_report = os.path.join(args.output_dir or ".", balance.BALANCE_FILE)
+    balancer = balance.LoadBalancer(e, end_time, args.rebalance_threshold, balance_report)
+
+  timer = timing.StepTimer(args.timings_dir, end_time, rank=e.mpi.rank, enabled=args.timings_dir is not None)
+
+  for t in range(start_day,stop_day):
+
+    timer.start_day(t)
 
     #if t>0:
-    ig.AddNewConflictZones(e,t)
+    if events.apply_conflicts(e,t):
+      sampler.conflicts_changed()
+    timer.lap("conflict_zones")
 
     # Determine number of new refugees to insert into the system.
-    new_refs = d.get_daily_difference(t, FullInterpolation=True) - refugee_debt
-    refugees_raw += d.get_daily_difference(t, FullInterpolation=True)
+    new_refs = int(daily_difference[t]) - refugee_debt
+    refugees_raw += int(daily_difference[t])
 
     #Refugees are pre-placed in Mali, so set new_refs to 0 on Day 0.
     if insert_day0_refugees_in_camps:  
@@ -88,48 +343,63 @@ if __name__ == "__main__":
       refugee_debt = 0
 
     #Insert refugee agents
-    for i in range(0, new_refs):
-      e.addAgent(e.pick_conflict_location())
-
-    e.refresh_conflict_weights()
-    t_data = t
-
-    e.enact_border_closures(t)
-    e.evolve()
-
-    #Calculation of error terms
-    errors = []
-    abs_errors = []
-    loc_data = []
-
-    camps = []
-    for i in camp_locations:
-      camps += [lm[i]]
-      loc_data += [d.get_field(i, t)]
-
-    # calculate retrofitted time.
-    refugees_in_camps_sim = 0
-    for c in camps:
-      refugees_in_camps_sim += c.numAgents
-
-    # calculate errors
-    j=0
-    for i in camp_locations:
-      errors += [a.rel_error(lm[i].numAgents, loc_data[j])]
-      abs_errors += [a.abs_error(lm[i].numAgents, loc_data[j])]
-
-      j += 1
-
-    output = "%s" % t
-
-    for i in range(0,len(errors)):
-      output += ",%s,%s,%s" % (lm[camp_locations[i]].numAgents, loc_data[i], errors[i])
-
-    if refugees_raw>0:
-      output += ",%s,%s,%s,%s,%s,%s" % (float(np.sum(abs_errors))/float(refugees_raw), int(sum(loc_data)), e.numAgents(), refugees_raw, refugees_in_camps_sim, refugee_debt)
+    if engine is not None:
+      engine.add_agents_to_conflict_zones(new_refs)
+    elif bulk_insertion:
+      insertion.add_agents_to_conflict_zones(e, new_refs)
     else:
-      output += ",0,0,0,0,0,0"
-
-    if e.getRankN(t):
-        print(output)
+      for i in range(0, new_refs):
+        e.addAgent(sampler.pick())
+    sampler.agents_inserted(new_refs)
+    timer.lap("insertion")
+
+    sampler.refresh()
+    timer.lap("conflict_weights")
+
+    events.apply_closures(e,t)
+    timer.lap("border_closures")
+    if balancer is not None:
+      balancer.start()
+    if day0_camps is not None:
+      day0_camps.release()
+    e.evolve()
+    if engine is not None:
+      engine.evolve()
+    timer.lap("evolve")
+    if balancer is not None:
+      balancer.day_done(t)
+    timer.lap("migration")
+
+    #Calculation of error terms, vectorized over all camps on each report
+    reporter.day_done(t, refugees_raw, refugee_debt)
+    if flow_recorder is not None:
+      flow_recorder.day_done(t)
+    if od_recorder is not None:
+      od_recorder.day_done(t)
+    if probe_set is not None:
+      probe_set.day_done(t, new_refs)
+    timer.lap("reporting")
+    timer.end_day(e, engine)
+
+    if args.checkpoint_every > 0 and (t+1) % args.checkpoint_every == 0 and t+1 < stop_day:
+      reporter.flush()
+      checkpoint.save(args.checkpoint_dir, t+1, e, res, refugees_raw, refugee_debt, keep=args.keep_checkpoints, engine=engine, dormant=day0_camps, recorders=recorders)
+
+  reporter.close()
+  timer.close()
+  if balancer is not None:
+    balancer.close()
+  if stop_day < end_time:
+    # End of a particle filter segment: keep the state and score it on the last observation day.
+    checkpoint.save(assimilation.segment_dir(args.assimilation_dir, segment, member), stop_day, e, res, refugees_raw, refugee_debt, engine=engine, dormant=day0_camps)
+    assimilation.write_score(args.assimilation_dir, segment, member, res.totals[stop_day - 1, results.GLOBAL_COLUMNS.index("Total error")])
+  if flow_recorder is not None:
+    flow_recorder.close(os.path.join(args.output_dir, flows.FLOWS_FILE))
+  if od_recorder is not None:
+    od_recorder.close(os.path.join(args.output_dir, od.OD_FILE))
+  if probe_set is not None:
+    probe_set.close(os.path.join(args.output_dir, probes.PROBES_FILE))
+
+  if member is not None:
+    ensemble.exit_member()
 